@@ -1,19 +1,51 @@
 import base64
 from dotenv import load_dotenv
+import hashlib
+import hmac
+import importlib
 import json
 import os
-from fastapi import FastAPI, File, HTTPException, UploadFile, Query
+from fastapi import Depends, FastAPI, File, Header, HTTPException, UploadFile, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
+from fastapi.responses import PlainTextResponse
+from datetime import datetime, timedelta
+from typing import List, Literal, Optional
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from pydantic import BaseModel
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
+import threading
+import time
+from cache import cache
+import catalog
+import metrics
+import profiling
+import partitions
+import rollups
+import suggest
 
 
 load_dotenv()
 
+# Time-to-ready is measured from here to the end of the startup handlers
+APP_LOADED = time.perf_counter()
+
+STARTUP_DURATION = metrics.Gauge(
+    "startup_duration_seconds", "Seconds spent in each startup stage, and until ready",
+    labels=("stage",),
+)
+STARTUP_RESIDENT_MEMORY = metrics.Gauge(
+    "startup_resident_memory_bytes", "Resident memory of the worker once ready",
+)
+
+# Seconds after startup to import the LLM stack in the background; 0 loads it on the first scan
+LLM_WARMUP_DELAY = float(os.getenv("LLM_WARMUP_DELAY", "5"))
+# Only /scan-ingredients needs them, and they take longer to import than the rest of the app
+LLM_MODULES = ("langchain_core.messages", "langchain_google_genai")
+
+# Operator endpoints (/metrics, /debug/*) need "Authorization: Bearer <OPS_TOKEN>";
+# without OPS_TOKEN they are not served at all
+OPS_TOKEN = os.getenv("OPS_TOKEN")
+
 
 class ImageScanRequest(BaseModel):
     image_url: str
@@ -35,6 +67,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Database configuration
 DB_CONFIG = {
@@ -46,17 +79,27 @@ DB_CONFIG = {
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Seconds; catalog data changes only when db.py reloads it (see cache.py --invalidate)
+CATALOG_TTL = 300
+RECIPES_TTL = 60
+SCAN_TTL = 24 * 60 * 60
+
 
 def get_db_connection():
     """Create and return a database connection."""
+    started = time.perf_counter()
     try:
         if DATABASE_URL:
             # Render provides a single DATABASE_URL; sslmode=require is needed for managed Postgres
-            return psycopg2.connect(DATABASE_URL, sslmode="require")
+            return psycopg2.connect(
+                DATABASE_URL, sslmode="require", connection_factory=metrics.InstrumentedConnection
+            )
 
-        return psycopg2.connect(**DB_CONFIG)
+        return psycopg2.connect(**DB_CONFIG, connection_factory=metrics.InstrumentedConnection)
     except psycopg2.Error as e:
         raise HTTPException(status_code=500, detail=f"Database connection failed: {str(e)}")
+    finally:
+        metrics.DB_CONNECT_DURATION.observe(time.perf_counter() - started)
 
 
 def get_or_create_user_id(conn, cursor, device_id: str) -> int:
@@ -77,32 +120,182 @@ def get_or_create_user_id(conn, cursor, device_id: str) -> int:
     return new_user["id"]
 
 
+# Catalog tables, mapped from a snapshot file shared by every worker (see catalog.py);
+# get_db_connection is looked up per call, so a replacement (bench.py) is used too
+shared_catalog = catalog.SharedCatalog(lambda: get_db_connection())
+
+
+# Seconds per startup stage, printed once ready
+startup_stages = {}
+
+
+def record_startup_stage(stage, started):
+    startup_stages[stage] = time.perf_counter() - started
+    STARTUP_DURATION.set(stage, value=startup_stages[stage])
+
+
+@app.on_event("startup")
+def attach_catalog_snapshot():
+    started = time.perf_counter()
+    try:
+        snapshot = shared_catalog.refresh()
+        print(f"✓ Catalog version {snapshot.version} attached from {shared_catalog.source}")
+    except Exception as e:
+        print(f"⚠ Catalog snapshot not attached at startup: {e}")
+    record_startup_stage("catalog", started)
+    catalog.start_background_refresh(shared_catalog)
+
+
+def get_catalog():
+    try:
+        return shared_catalog.get()
+    except (psycopg2.Error, OSError) as e:
+        raise HTTPException(status_code=500, detail=f"Catalog snapshot unavailable: {str(e)}")
+
+
+@app.on_event("startup")
+def start_click_maintenance():
+    rollups.start_background_aggregator(get_db_connection)
+    partitions.start_background_maintenance(get_db_connection)
+
+
+def load_ingredient_suggestions():
+    """Prefix index over the catalog, with how many recipes and pantries use each ingredient."""
+    snapshot = shared_catalog.get()
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT ingredient_id, COUNT(*) FROM user_ingredient GROUP BY ingredient_id;")
+            pantry_uses = dict(cursor.fetchall())
+    finally:
+        conn.close()
+
+    recipe_uses = snapshot.recipe_uses()
+    ingredients = snapshot.ingredients()
+    for ingredient in ingredients:
+        ingredient["popularity"] = recipe_uses.get(ingredient["id"], 0) + pantry_uses.get(ingredient["id"], 0)
+    return suggest.PrefixIndex(ingredients)
+
+
+# Rebuilt when the catalog snapshot changes version, or after CATALOG_TTL
+ingredient_suggestions = suggest.CatalogIndex(
+    load_ingredient_suggestions, lambda: shared_catalog.get().version, max_age=CATALOG_TTL,
+)
+
+
+@app.on_event("startup")
+def build_ingredient_suggestions():
+    started = time.perf_counter()
+    try:
+        ingredient_suggestions.get()
+    except Exception as e:
+        print(f"⚠ Ingredient suggestions not built at startup: {e}")
+    record_startup_stage("suggestions", started)
+
+
+def load_llm_modules():
+    for name in LLM_MODULES:
+        importlib.import_module(name)
+
+
+@app.on_event("startup")
+def schedule_llm_warmup():
+    """Import the LLM stack shortly after the server starts accepting requests."""
+    if LLM_WARMUP_DELAY <= 0:
+        return
+
+    def warm_up():
+        time.sleep(LLM_WARMUP_DELAY)
+        started = time.perf_counter()
+        try:
+            load_llm_modules()
+        except Exception as e:
+            print(f"⚠ LLM warm-up failed: {e}")
+            return
+        record_startup_stage("llm_warmup", started)
+        print(f"✓ LLM stack loaded in {startup_stages['llm_warmup'] * 1000:.0f}ms")
+
+    threading.Thread(target=warm_up, name="llm-warmup", daemon=True).start()
+
+
+@app.on_event("startup")
+def report_ready():
+    record_startup_stage("ready", APP_LOADED)
+    resident = metrics.resident_memory()
+    STARTUP_RESIDENT_MEMORY.set(value=resident)
+    stages = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in startup_stages.items() if stage != "ready")
+    print(f"✓ Ready in {startup_stages['ready'] * 1000:.0f}ms ({stages}), RSS {resident / 2 ** 20:.0f} MiB")
+
+
+def get_vision_llm():
+    """
+    Build the model used by /scan-ingredients; the LangChain modules are
+    imported here on first use unless the warm-up already did.
+    Replaced by loadtest.py with a fake that replays canned responses.
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        temperature=0,
+        max_retries=2,
+    )
+
+
 @app.get("/")
 def read_root():
     return {"message": "Cocina API - Use /docs for API documentation"}
 
 
+def require_ops_token(authorization: Optional[str] = Header(None)):
+    """Dependency of the operator endpoints: they expose query shapes and plans."""
+    if not OPS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((authorization or "").encode(), f"Bearer {OPS_TOKEN}".encode()):
+        raise HTTPException(
+            status_code=401, detail="Invalid or missing operator token", headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_ops_token)])
+def get_metrics():
+    """
+    Prometheus metrics: request latency per route and status, DB statement
+    timings per route, connection acquisition time, LLM latency and tokens.
+    Scrape with the operator token as bearer token.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/slow-queries", include_in_schema=False, dependencies=[Depends(require_ops_token)])
+def get_slow_queries(limit: int = Query(20, ge=1, le=200)):
+    """
+    Statements slower than SLOW_QUERY_MS, by total time, with sampled plans.
+    """
+    if profiling.slow_query_log is None:
+        raise HTTPException(status_code=404, detail="Slow query capture is disabled. Set SLOW_QUERY_MS to enable it.")
+
+    return {
+        "threshold_ms": profiling.slow_query_log.threshold * 1000,
+        "explain_rate": profiling.slow_query_log.explain_rate,
+        "statements": profiling.slow_query_log.top(limit),
+    }
+
+
+@app.get("/debug/cache", include_in_schema=False, dependencies=[Depends(require_ops_token)])
+def get_cache_stats():
+    """
+    Hits, misses, sets, evictions and invalidations per cache namespace.
+    """
+    return cache.stats()
+
+
 @app.get("/ingredients/all")
 def get_all_ingredients():
     """
-    Get all ingredients
+    Get all ingredients, by id
     """
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute(
-                """
-                SELECT id, name, name_es, img_url
-                FROM ingredient
-                """
-            )
-            ingredients = cursor.fetchall()
-            return ingredients
-
-    except psycopg2.Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
+    return get_catalog().ingredients()
 
 
 @app.get("/ingredients/basics")
@@ -112,19 +305,68 @@ def get_basic_ingredients():
     """
     basic_ingredients_ids = [30, 260, 309, 282, 249, 276, 187, 183, 303, 36, 236,
                              125, 112, 197, 137]
+    snapshot = get_catalog()
+    basic_ingredients = [snapshot.ingredient(ingredient_id) for ingredient_id in sorted(basic_ingredients_ids)]
+    return [ingredient for ingredient in basic_ingredients if ingredient is not None]
+
+
+# Declared before /recipes/{device_id}, which would otherwise match "search"
+@app.get("/recipes/search")
+def search_recipes(
+    q: str = Query(..., min_length=1, max_length=100),
+    instructions: bool = False,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+):
+    """
+    Search recipes by English or Spanish name, ignoring case and accents,
+    and with `instructions=true` also by instruction text (slower for
+    common words). Whole words go through the full-text indexes with each
+    language's stemmer; partial or misspelled words through the trigram
+    index on both names. Results are ranked by how well the name matches.
+    """
+    # Keyed by catalog version, so a catalog reload is never answered from stale entries
+    key = f"{get_catalog().version}:{int(instructions)}:{limit}:{offset}:{q.strip().lower()}"
+    cached = cache.get("search", key)
+    if cached is not None:
+        return cached
+
     conn = get_db_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Each condition is served by its own GIN index (BitmapOr)
+            conditions = "r.name_vector @@ query.words OR query.text <%% r.search_name"
+            if instructions:
+                conditions += " OR r.instructions_vector @@ query.words"
+
+            # One extra row tells whether there is a next page, without a COUNT
             cursor.execute(
-                """
-                SELECT id, name, name_es, img_url
-                FROM ingredient
-                WHERE id = ANY(%s)
+                f"""
+                WITH query AS (
+                    SELECT websearch_to_tsquery('english', f_unaccent(%(q)s))
+                           || websearch_to_tsquery('spanish', f_unaccent(%(q)s)) AS words,
+                           f_unaccent(lower(%(q)s)) AS text
+                )
+                SELECT r.id, r.name, r.name_es, r.minutes, r.rating, r.img_url,
+                       ts_rank(r.name_vector, query.words) + word_similarity(query.text, r.search_name) AS rank
+                FROM recipe r, query
+                WHERE {conditions}
+                ORDER BY rank DESC, r.id
+                LIMIT %(limit)s OFFSET %(offset)s;
                 """,
-                (basic_ingredients_ids,)
+                {"q": q, "limit": limit + 1, "offset": offset},
             )
-            basic_ingredients = cursor.fetchall()
-            return basic_ingredients
+            recipes = cursor.fetchall()
+
+            result = {
+                "query": q,
+                "limit": limit,
+                "offset": offset,
+                "has_more": len(recipes) > limit,
+                "recipes": recipes[:limit],
+            }
+            cache.set("search", key, result, ttl=CATALOG_TTL)
+            return result
 
     except psycopg2.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -132,98 +374,100 @@ def get_basic_ingredients():
         conn.close()
 
 
+def build_user_recipes(cursor, user_id, snapshot, max_missing):
+    """Recipes sharing at least one ingredient with the user's pantry, for get_recipes."""
+    # Get all ingredients of user
+    cursor.execute(
+        "SELECT ingredient_id FROM user_ingredient WHERE user_id = %s;",
+        (user_id,)
+    )
+    user_ingredients_ids = [row['ingredient_id'] for row in cursor.fetchall()]
+    if not user_ingredients_ids:
+        return {'recipes': []}
+
+    # Candidate recipes and their counts are kept up to date by triggers
+    # on every pantry and catalog change (user_recipe_match, see migrations.py)
+    conditions = "user_id = %s"
+    params = [user_id]
+    if max_missing is not None:
+        conditions += " AND missing_count <= %s"
+        params.append(max_missing)
+    cursor.execute(
+        f"SELECT recipe_id, match_count FROM user_recipe_match WHERE {conditions} ORDER BY recipe_id;",
+        params,
+    )
+    matches = cursor.fetchall()
+
+    # Recipe, ingredient and product details come from the shared catalog snapshot
+    user_ingredients_set = set(user_ingredients_ids)
+    ingredients_by_id = {}
+    products_by_ingredient = {}
+    user_recipes = []
+    for match in matches:
+        recipe = snapshot.recipe(match['recipe_id'])
+        if recipe is None:
+            # Deleted since the snapshot was taken
+            continue
+        recipe['match_count'] = match['match_count']
+
+        ingredients = []
+        for ingredient_id in recipe.pop('ingredient_ids'):
+            if ingredient_id not in ingredients_by_id:
+                ingredients_by_id[ingredient_id] = snapshot.ingredient(
+                    ingredient_id, ("id", "name", "img_url", "name_es")
+                )
+            if ingredients_by_id[ingredient_id] is not None:
+                ingredients.append(ingredients_by_id[ingredient_id])
+        recipe['ingredients'] = ingredients
+        recipe['matching_ingredients'] = [
+            ingredient for ingredient in ingredients if ingredient['id'] in user_ingredients_set
+        ]
+        recipe['missing_ingredients'] = [
+            ingredient for ingredient in ingredients if ingredient['id'] not in user_ingredients_set
+        ]
+        for ingredient in recipe['missing_ingredients']:
+            if ingredient['id'] not in products_by_ingredient:
+                products_by_ingredient[ingredient['id']] = snapshot.products_for(ingredient['id'])
+        recipe['missing_products'] = sorted(
+            (
+                product
+                for ingredient in recipe['missing_ingredients']
+                for product in products_by_ingredient[ingredient['id']]
+            ),
+            key=lambda product: product['id'],
+        )
+        user_recipes.append(recipe)
+
+    return {
+        'recipes': user_recipes,
+    }
+
+
 @app.get("/recipes/{device_id}")
-def get_recipes(device_id: str):
+def get_recipes(device_id: str, max_missing: Optional[int] = Query(None, ge=0)):
     """
     Get all the recipes whose ingredients match at least 1 user's ingredient.
     Include matching ingredients and missing ingredients.
+    With `max_missing`, only recipes missing at most that many ingredients
+    (0: cookable now).
+    Results are cached under the pantry and catalog versions, so a change
+    to either is never served stale; concurrent identical requests share
+    one computation.
     """
     conn = get_db_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
             user_id = get_or_create_user_id(conn, cursor, device_id)
-
-            # Get all ingredients on database
-            query = """
-SELECT * FROM ingredient;
-"""
-            cursor.execute(query)
-            all_ingredients = cursor.fetchall()
-
-            # Get all ingredients of user
-            query = """
-SELECT * FROM "user"
-INNER JOIN user_ingredient ON "user".id = user_ingredient.user_id
-INNER JOIN ingredient ON user_ingredient.ingredient_id = ingredient.id
-WHERE "user".id = %s;
-"""
-            cursor.execute(query, (user_id,))
-            user_ingredients = cursor.fetchall()
-
-            # Get all the recipes on the database
-            query = """
-SELECT * FROM recipe;
-"""
-            cursor.execute(query)
-            all_recipes = cursor.fetchall()
-
-            # Get all products to attach missing products later
-            query = """
-SELECT * FROM product;
-"""
-            cursor.execute(query)
-            all_products = cursor.fetchall()
-
-            # Get all the recipe_ingredient junctions and filter by user
-            query = """
-SELECT * FROM recipe_ingredient;
-"""
-            cursor.execute(query)
-            recipe_ingredient_junctions = cursor.fetchall()
-
-            # Filter recipe_ingredient_junctions of user ingredients
-            user_ingredients_ids = [ingredient['id'] for ingredient in user_ingredients]
-            user_recipe_ingredient_junctions = []
-            for junction in recipe_ingredient_junctions:
-                if junction['ingredient_id'] in user_ingredients_ids:
-                    user_recipe_ingredient_junctions.append(junction)
-
-            # Get all user recipes (at least 1 matching ingredient)
-            user_recipes_ids = [junction['recipe_id'] for junction in user_recipe_ingredient_junctions]
-            user_recipes = []
-            for recipe in all_recipes:
-                if recipe['id'] in user_recipes_ids:
-                    user_recipes.append(recipe)
-
-            # Extend user_recipes with its ingredients 
-            for recipe in user_recipes:
-                ingredients_ids = [
-                    junction['ingredient_id'] for junction in recipe_ingredient_junctions if recipe['id'] == junction['recipe_id']
-                ]
-                ingredients = [
-                    ingredient for ingredient in all_ingredients if ingredient['id'] in ingredients_ids
-                ]
-                recipe['ingredients'] = ingredients
-
-            # Extend user_recipes with its missing ingredients
-            for recipe in user_recipes:
-                matching_ingredients = []
-                missing_ingredients = []
-                for ingredient in recipe['ingredients']:
-                    if ingredient['id'] in user_ingredients_ids:
-                        matching_ingredients.append(ingredient)
-                    else:
-                        missing_ingredients.append(ingredient)
-                recipe['matching_ingredients'] = matching_ingredients
-                recipe['missing_ingredients'] = missing_ingredients
-                missing_ids = {ingredient['id'] for ingredient in missing_ingredients}
-                recipe['missing_products'] = [
-                    product for product in all_products if product.get('ingredient_id') in missing_ids
-                ]
-
-            return {
-                'recipes': user_recipes,
-            }
+            cursor.execute('SELECT pantry_version FROM "user" WHERE id = %s;', (user_id,))
+            pantry_version = cursor.fetchone()["pantry_version"]
+            snapshot = get_catalog()
+
+            return cache.get_or_set(
+                "recipes",
+                f"{user_id}:{pantry_version}:{snapshot.version}:{max_missing}",
+                lambda: build_user_recipes(cursor, user_id, snapshot, max_missing),
+                ttl=RECIPES_TTL,
+            )
 
     except psycopg2.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -231,16 +475,84 @@ SELECT * FROM recipe_ingredient;
         conn.close()
 
 
+# Declared before /ingredients/{device_id}, which would otherwise match "suggest"
+@app.get("/ingredients/suggest")
+def suggest_ingredients(
+    prefix: str = Query(..., max_length=50),
+    lang: Literal["en", "es"] = "en",
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Autocomplete ingredient names, ignoring case and accents, from an
+    in-memory prefix index. Names starting with the prefix come first,
+    then names with a later word starting with it; common ingredients
+    rank higher.
+    """
+    try:
+        index = ingredient_suggestions.get()
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    return index.suggest(prefix, lang, limit)
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
 @app.get("/ingredients/{device_id}")
-def get_user_ingredients(device_id: str):
+def get_user_ingredients(device_id: str, request: Request, response: Response, since: Optional[int] = None):
     """
     Get all ingredients of a user.
+
+    The ETag is the pantry version. With a matching If-None-Match, or with
+    `since` equal to the current version, the answer is 304. With an older
+    `since`, only the ingredient ids added and removed since that version are
+    returned; if that history is no longer kept, the full pantry is returned
+    with "reset": true.
     """
     conn = get_db_connection()
     try:
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
             user_id = get_or_create_user_id(conn, cursor, device_id)
 
+            cursor.execute('SELECT pantry_version FROM "user" WHERE id = %s;', (user_id,))
+            version = cursor.fetchone()["pantry_version"]
+            etag = f'"{version}"'
+            if since == version or etag_matches(request, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+
+            if since is not None and 0 <= since < version:
+                cursor.execute(
+                    "SELECT MIN(version) AS oldest FROM pantry_change WHERE user_id = %s;",
+                    (user_id,),
+                )
+                oldest = cursor.fetchone()["oldest"]
+                if oldest is not None and since >= oldest - 1:
+                    # Net effect per ingredient: present now but not at `since`, or the reverse
+                    cursor.execute(
+                        """
+                        SELECT ingredient_id,
+                               (array_agg(added ORDER BY version))[1] AS first_added,
+                               (array_agg(added ORDER BY version DESC))[1] AS last_added
+                        FROM pantry_change
+                        WHERE user_id = %s AND version > %s
+                        GROUP BY ingredient_id
+                        ORDER BY ingredient_id;
+                        """,
+                        (user_id, since),
+                    )
+                    changes = cursor.fetchall()
+                    return {
+                        "version": version,
+                        "added": [c["ingredient_id"] for c in changes if c["first_added"] and c["last_added"]],
+                        "removed": [c["ingredient_id"] for c in changes if not c["first_added"] and not c["last_added"]],
+                    }
+
             # Join the ingredient table with the junction table
             query = """
             SELECT i.id, i.name, i.name_es, i.img_url
@@ -253,6 +565,8 @@ def get_user_ingredients(device_id: str):
             cursor.execute(query, (user_id,))
             user_ingredients = cursor.fetchall()
 
+            if since is not None:
+                return {"version": version, "reset": True, "ingredients": user_ingredients}
             return user_ingredients
 
     except psycopg2.Error as e:
@@ -299,6 +613,205 @@ def log_product_click(click: ProductClickRequest):
         conn.close()
 
 
+# Rollup tables and the column naming the grouped entity, by `by` and `period`
+CLICK_ROLLUPS = {
+    ("product", "hour"): ("product_click_hour", "product_id"),
+    ("product", "day"): ("product_click_day", "product_id"),
+    ("ingredient", "hour"): ("ingredient_click_hour", "ingredient_id"),
+    ("ingredient", "day"): ("ingredient_click_day", "ingredient_id"),
+}
+
+
+def click_window(period, since, until):
+    """Default window: the last 24 hours by hour, the last 30 days by day."""
+    until = until or datetime.now()
+    since = since or until - (timedelta(hours=24) if period == "hour" else timedelta(days=30))
+    if period == "day":
+        return since.date(), until.date()
+    return since, until
+
+
+@app.get("/analytics/clicks/top")
+def get_top_clicked(
+    by: Literal["product", "ingredient"] = "product",
+    period: Literal["hour", "day"] = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(10, ge=1, le=100),
+):
+    """
+    Most clicked products or ingredients in a time window, read from the
+    click rollups (clicks newer than `as_of_click_id` are not counted yet).
+    """
+    table, column = CLICK_ROLLUPS[(by, period)]
+    entity = "product" if by == "product" else "ingredient"
+    since, until = click_window(period, since, until)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                f"""
+                SELECT r.{column} AS id, e.name, SUM(r.clicks)::int AS clicks
+                FROM {table} r
+                LEFT JOIN {entity} e ON e.id = r.{column}
+                WHERE r.bucket >= %s AND r.bucket <= %s
+                GROUP BY r.{column}, e.name
+                ORDER BY clicks DESC, r.{column}
+                LIMIT %s;
+                """,
+                (since, until, limit),
+            )
+            top = cursor.fetchall()
+            as_of, rolled_up_at = rollups.watermark(cursor)
+
+            return {
+                "by": by,
+                "period": period,
+                "since": since,
+                "until": until,
+                "as_of_click_id": as_of,
+                "rolled_up_at": rolled_up_at,
+                "top": top,
+            }
+
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        conn.close()
+
+
+@app.get("/analytics/clicks/series")
+def get_click_series(
+    id: int,
+    by: Literal["product", "ingredient"] = "product",
+    period: Literal["hour", "day"] = "day",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """
+    Clicks per hour or day for one product or ingredient, from the rollups.
+    Buckets without clicks are omitted.
+    """
+    table, column = CLICK_ROLLUPS[(by, period)]
+    since, until = click_window(period, since, until)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                f"""
+                SELECT bucket, clicks
+                FROM {table}
+                WHERE {column} = %s AND bucket >= %s AND bucket <= %s
+                ORDER BY bucket;
+                """,
+                (id, since, until),
+            )
+            series = cursor.fetchall()
+            as_of, rolled_up_at = rollups.watermark(cursor)
+
+            return {
+                "by": by,
+                "id": id,
+                "period": period,
+                "since": since,
+                "until": until,
+                "as_of_click_id": as_of,
+                "rolled_up_at": rolled_up_at,
+                "series": series,
+            }
+
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        conn.close()
+
+
+# Columns returned for each kind of recommended item
+RECOMMENDED_COLUMNS = {
+    "ingredient": "e.id, e.name, e.name_es, e.img_url",
+    "product": "e.id, e.name, e.price, e.url, e.ingredient_id",
+}
+
+# Recommended items that are no longer offered
+RECOMMENDED_EXCLUDED = {
+    "ingredient": "",
+    "product": "AND e.removed_at IS NULL",
+}
+
+
+@app.get("/recommendations/pantry/{device_id}")
+def get_pantry_recommendations(device_id: str, limit: int = Query(10, ge=1, le=50)):
+    """
+    Ingredients the user does not have that people with similar pantries
+    have: the neighbors of every pantry ingredient, scores summed.
+    Precomputed by recommend.py.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            user_id = get_or_create_user_id(conn, cursor, device_id)
+            cursor.execute(
+                """
+                SELECT e.id, e.name, e.name_es, e.img_url, ROUND(SUM(n.score)::numeric, 4)::float AS score
+                FROM user_ingredient ui
+                JOIN item_neighbor r ON r.kind = 'ingredient' AND r.item_id = ui.ingredient_id
+                CROSS JOIN LATERAL unnest(r.neighbor_ids, r.scores) AS n(neighbor_id, score)
+                JOIN ingredient e ON e.id = n.neighbor_id
+                WHERE ui.user_id = %s
+                  AND NOT EXISTS (
+                      SELECT 1 FROM user_ingredient o
+                      WHERE o.user_id = ui.user_id AND o.ingredient_id = n.neighbor_id
+                  )
+                GROUP BY e.id
+                ORDER BY score DESC, e.id
+                LIMIT %s;
+                """,
+                (user_id, limit),
+            )
+            return cursor.fetchall()
+
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        conn.close()
+
+
+@app.get("/recommendations/{kind}/{item_id}")
+def get_item_recommendations(
+    kind: Literal["ingredient", "product"],
+    item_id: int,
+    limit: int = Query(10, ge=1, le=50),
+):
+    """
+    Items most often found together with an ingredient (in pantries) or a
+    product (in clicks), best first, with their cosine similarity.
+    Precomputed by recommend.py; an item without neighbors yet gets [].
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                f"""
+                SELECT {RECOMMENDED_COLUMNS[kind]}, n.score
+                FROM item_neighbor r
+                CROSS JOIN LATERAL unnest(r.neighbor_ids, r.scores) WITH ORDINALITY AS n(neighbor_id, score, rank)
+                JOIN {kind} e ON e.id = n.neighbor_id
+                WHERE r.kind = %s AND r.item_id = %s {RECOMMENDED_EXCLUDED[kind]}
+                ORDER BY n.rank
+                LIMIT %s;
+                """,
+                (kind, item_id, limit),
+            )
+            return cursor.fetchall()
+
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        conn.close()
+
+
 @app.post("/scan-ingredients")
 async def scan_ingredients(file: UploadFile = File(...)):
     """
@@ -307,25 +820,25 @@ async def scan_ingredients(file: UploadFile = File(...)):
     """
     conn = get_db_connection()
     try:
-        # Fetch the master list of ingredients from the database
-        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            cursor.execute("SELECT id, name, name_es FROM ingredient")
-            db_ingredients = cursor.fetchall()
+        # Read the uploaded file; the same photo gets the cached answer
+        image_data = await file.read()
+        if not image_data:
+            raise HTTPException(status_code=400, detail="Empty or invalid image file")
+
+        # Keyed by catalog version too: answers list catalog ids, which merges and reloads change
+        scan_key = f"{get_catalog().version}:{hashlib.sha256(image_data).hexdigest()}"
+        cached = cache.get("scan", scan_key)
+        if cached is not None:
+            return cached
+
+        # Fetch the master list of ingredients (cached with the catalog)
+        db_ingredients = get_all_ingredients()
 
         # Convert to a simplified string/JSON representation for the prompt
         ingredients_context = ", ".join([f"{ing['id']}: {ing['name']}" for ing in db_ingredients])
 
         # Setup LLM
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0,
-            max_retries=2,
-        )
-
-        # Read and encode the uploaded file
-        image_data = await file.read()
-        if not image_data:
-            raise HTTPException(status_code=400, detail="Empty or invalid image file")
+        llm = get_vision_llm()
 
         # Detect MIME type (e.g., 'jpeg', 'png') from UploadFile
         content_type = file.content_type.split('/')[-1] if file.content_type else 'jpeg'  # Fallback to jpeg if unknown
@@ -334,6 +847,8 @@ async def scan_ingredients(file: UploadFile = File(...)):
         base64_image = base64.b64encode(image_data).decode('utf-8')
 
         # Construct the Multimodal Prompt
+        from langchain_core.messages import HumanMessage
+
         message = HumanMessage(
             content=[
                 {
@@ -369,7 +884,17 @@ async def scan_ingredients(file: UploadFile = File(...)):
         )
 
         # Invoke LLM
-        response = llm.invoke([message])
+        started = time.perf_counter()
+        try:
+            response = llm.invoke([message])
+        except Exception:
+            metrics.LLM_CALL_DURATION.observe(time.perf_counter() - started, "scan", "error")
+            raise
+        metrics.LLM_CALL_DURATION.observe(time.perf_counter() - started, "scan", "ok")
+        usage = getattr(response, "usage_metadata", None) or {}
+        for direction in ("input", "output"):
+            if usage.get(f"{direction}_tokens") is not None:
+                metrics.LLM_TOKENS.observe(usage[f"{direction}_tokens"], "scan", direction)
         
         # Clean and Parse JSON
         content = response.content.strip()
@@ -385,11 +910,13 @@ async def scan_ingredients(file: UploadFile = File(...)):
         detected_ids = [item.get("id") for item in detected_ingredients if item.get("id") is not None]
 
         if not detected_ids:
-            return {
+            result = {
                 "status": "success",
                 "detected_count": 0,
                 "ingredients": [],
             }
+            cache.set("scan", scan_key, result, ttl=SCAN_TTL)
+            return result
 
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
             cursor.execute(
@@ -402,11 +929,13 @@ async def scan_ingredients(file: UploadFile = File(...)):
             )
             ingredients_with_media = cursor.fetchall()
 
-        return {
+        result = {
             "status": "success",
             "detected_count": len(ingredients_with_media),
             "ingredients": ingredients_with_media
         }
+        cache.set("scan", scan_key, result, ttl=SCAN_TTL)
+        return result
 
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail="Failed to parse AI response. The model did not return valid JSON.")
@@ -428,26 +957,98 @@ def add_user_ingredients(device_id: str, ingredient_ids: List[int]):
         with conn.cursor(cursor_factory=RealDictCursor) as cursor:
             user_id = get_or_create_user_id(conn, cursor, device_id)
 
-            # Insert ingredients (ignore duplicates)
-            added_count = 0
-            for ingredient_id in ingredient_ids:
-                cursor.execute(
-                    """
+            # Insert ingredients (ignore duplicates) in one statement, so the
+            # pantry version is bumped once per request
+            cursor.execute(
+                """
+                INSERT INTO user_ingredient (user_id, ingredient_id)
+                SELECT %s, ingredient_id FROM unnest(%s::int[]) AS ingredient_id
+                ON CONFLICT DO NOTHING;
+                """,
+                (user_id, ingredient_ids)
+            )
+            added_count = cursor.rowcount
+
+            cursor.execute('SELECT pantry_version FROM "user" WHERE id = %s;', (user_id,))
+            version = cursor.fetchone()["pantry_version"]
+            conn.commit()
+
+            return {
+                "status": "success",
+                "added_count": added_count,
+                "total_requested": len(ingredient_ids),
+                "pantry_version": version,
+            }
+
+    except psycopg2.Error as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    finally:
+        conn.close()
+
+
+@app.put("/ingredients/{device_id}")
+def replace_user_ingredients(device_id: str, ingredient_ids: List[int]):
+    """
+    Replace a user's pantry with exactly these ingredients, in one
+    transaction. Returns the ingredient ids added and removed.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Before the user is created: a rejected replace changes nothing
+            cursor.execute(
+                """
+                SELECT array_agg(DISTINCT d.id ORDER BY d.id) AS unknown
+                FROM unnest(%s::int[]) AS d(id)
+                LEFT JOIN ingredient i ON i.id = d.id
+                WHERE i.id IS NULL;
+                """,
+                (ingredient_ids,)
+            )
+            unknown = cursor.fetchone()["unknown"]
+            if unknown:
+                raise HTTPException(status_code=404, detail=f"Ingredients not found: {unknown}")
+
+            user_id = get_or_create_user_id(conn, cursor, device_id)
+
+            # Concurrent replaces of the same pantry apply one after the other
+            cursor.execute('SELECT id FROM "user" WHERE id = %s FOR UPDATE;', (user_id,))
+
+            # Both sides of the diff in one statement
+            cursor.execute(
+                """
+                WITH desired AS (
+                    SELECT DISTINCT unnest(%(ids)s::int[]) AS ingredient_id
+                ),
+                removed AS (
+                    DELETE FROM user_ingredient
+                    WHERE user_id = %(user_id)s
+                      AND ingredient_id NOT IN (SELECT ingredient_id FROM desired)
+                    RETURNING ingredient_id
+                ),
+                added AS (
                     INSERT INTO user_ingredient (user_id, ingredient_id)
-                    VALUES (%s, %s)
-                    ON CONFLICT DO NOTHING;
-                    """,
-                    (user_id, ingredient_id)
+                    SELECT %(user_id)s, ingredient_id FROM desired
+                    ON CONFLICT DO NOTHING
+                    RETURNING ingredient_id
                 )
-                if cursor.rowcount > 0:
-                    added_count += 1
+                SELECT
+                    ARRAY(SELECT ingredient_id FROM added ORDER BY ingredient_id) AS added,
+                    ARRAY(SELECT ingredient_id FROM removed ORDER BY ingredient_id) AS removed;
+                """,
+                {"ids": ingredient_ids, "user_id": user_id}
+            )
+            changes = cursor.fetchone()
 
+            cursor.execute('SELECT pantry_version FROM "user" WHERE id = %s;', (user_id,))
+            version = cursor.fetchone()["pantry_version"]
             conn.commit()
 
             return {
                 "status": "success",
-                "added_count": added_count,
-                "total_requested": len(ingredient_ids)
+                "added": changes["added"],
+                "removed": changes["removed"],
+                "pantry_version": version,
             }
 
     except psycopg2.Error as e:
@@ -481,9 +1082,11 @@ def delete_user_ingredient(device_id: str, ingredient_id: int):
             if cursor.rowcount == 0:
                 raise HTTPException(status_code=404, detail="Ingredient not associated with user")
 
+            cursor.execute('SELECT pantry_version FROM "user" WHERE id = %s;', (user_id,))
+            version = cursor.fetchone()["pantry_version"]
             conn.commit()
 
-            return {"status": "success", "deleted": True, "ingredient_id": ingredient_id}
+            return {"status": "success", "deleted": True, "ingredient_id": ingredient_id, "pantry_version": version}
 
     except psycopg2.Error as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
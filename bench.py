@@ -0,0 +1,395 @@
+"""
+Synthetic-scale benchmarks for the recipe and pantry endpoints.
+
+The generator reproduces the shape of the real catalog in cocina.sql
+(ingredients per recipe, ingredient popularity, pantry sizes, products per
+ingredient) at any scale, seeds a scratch database and then drives the
+endpoints in-process through FastAPI's TestClient (needs httpx).
+
+Response caches are off by default, so every request takes the query path
+and results stay comparable across commits; --cache keeps them on and
+measures warm-cache serving instead (recorded in the report's params).
+
+The target database must already have the schema:
+
+    createdb cocina_bench
+    psql cocina_bench < cocina.sql
+    DB_NAME=cocina_bench python migrations.py
+
+Usage:
+    python bench.py --dsn "dbname=cocina_bench" --recipes 100000 --ingredients 5000 --users 1000
+    python bench.py --compare bench_results/old.json bench_results/new.json
+
+Every table of the target database is truncated before seeding; the
+database named "cocina" is refused unless --force is given.
+"""
+import argparse
+from collections import Counter
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import psycopg2
+import psycopg2.extensions
+
+
+def read_copy_blocks(path="cocina.sql"):
+    """Return {table: [row, ...]} from the COPY sections of a pg_dump file."""
+    tables = {}
+    current = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if current is None:
+                if line.startswith("COPY public."):
+                    current = line.split()[1].replace("public.", "").strip('"')
+                    tables[current] = []
+            elif line == "\\.":
+                current = None
+            else:
+                tables[current].append(line.split("\t"))
+    return tables
+
+
+def load_distributions(path="cocina.sql"):
+    """Measure the distributions the generator samples from."""
+    tables = read_copy_blocks(path)
+
+    per_recipe = Counter(row[0] for row in tables["recipe_ingredient"])
+    popularity = Counter(row[1] for row in tables["recipe_ingredient"])
+    per_user = Counter(row[0] for row in tables["user_ingredient"])
+    per_ingredient = Counter(row[4] for row in tables["product"] if row[4] != "\\N")
+
+    ingredient_count = len(tables["ingredient"])
+    return {
+        "ingredients_per_recipe": list(per_recipe.values()),
+        # Popularity ranks, most used first; unused ingredients get weight 1
+        "popularity": sorted(popularity.values(), reverse=True)
+        + [1] * max(0, ingredient_count - len(popularity)),
+        "pantry_sizes": list(per_user.values()) or [5],
+        "products_per_ingredient": list(per_ingredient.values()),
+        "product_coverage": len(per_ingredient) / max(ingredient_count, 1),
+        "ingredient_names": [row[1] for row in tables["ingredient"]],
+        "recipe_names": [row[1] for row in tables["recipe"]],
+    }
+
+
+def scaled_weights(popularity, count):
+    """Stretch the measured popularity curve to `count` ingredients."""
+    return [popularity[int(i * len(popularity) / count)] for i in range(count)]
+
+
+def copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join("\\N" if value is None else str(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def seed(connection, recipes, ingredients, users, pantry_size=None, distributions=None, rng=None):
+    """
+    Replace the contents of the target database with a synthetic catalog.
+    Returns the device ids of the generated users.
+    """
+    distributions = distributions or load_distributions()
+    rng = rng or random.Random(42)
+    started = time.perf_counter()
+
+    names = distributions["ingredient_names"]
+    recipe_names = distributions["recipe_names"]
+    weights = scaled_weights(distributions["popularity"], ingredients)
+    ingredient_ids = list(range(1, ingredients + 1))
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            TRUNCATE product_click, user_ingredient, "user", product,
+                     recipe_ingredient, recipe, ingredient
+            RESTART IDENTITY CASCADE;
+            """
+        )
+
+        copy_rows(cursor, "ingredient", ["id", "name", "name_es", "img_url"], (
+            (i, f"{names[(i - 1) % len(names)]} {i}", f"{names[(i - 1) % len(names)]} es {i}",
+             f"https://img.example/{i}.png")
+            for i in ingredient_ids
+        ))
+
+        copy_rows(cursor, "recipe", ["id", "name", "name_es", "minutes", "rating", "instructions", "instructions_es"], (
+            (r, f"{recipe_names[(r - 1) % len(recipe_names)]} {r}", None, rng.randint(5, 120), None,
+             "Mix everything and cook.", "Mezclar todo y cocinar.")
+            for r in range(1, recipes + 1)
+        ))
+
+        def junctions():
+            for r in range(1, recipes + 1):
+                size = min(rng.choice(distributions["ingredients_per_recipe"]), ingredients)
+                for ingredient_id in set(rng.choices(ingredient_ids, weights=weights, k=size)):
+                    yield r, ingredient_id
+
+        copy_rows(cursor, "recipe_ingredient", ["recipe_id", "ingredient_id"], junctions())
+
+        def products():
+            product_id = 0
+            for ingredient_id in ingredient_ids:
+                if rng.random() > distributions["product_coverage"]:
+                    continue
+                for _ in range(rng.choice(distributions["products_per_ingredient"])):
+                    product_id += 1
+                    yield (product_id, f"Producto {product_id}", rng.randint(500, 15000),
+                           f"https://www.jumbo.cl/producto-{product_id}/p", ingredient_id)
+
+        copy_rows(cursor, "product", ["id", "name", "price", "url", "ingredient_id"], products())
+
+        device_ids = [f"bench-{u}" for u in range(1, users + 1)]
+        copy_rows(cursor, '"user"', ["id", "name", "device_id"], (
+            (u, device_id, device_id) for u, device_id in enumerate(device_ids, start=1)
+        ))
+
+        def pantries():
+            for u in range(1, users + 1):
+                size = min(pantry_size or rng.choice(distributions["pantry_sizes"]), ingredients)
+                for ingredient_id in set(rng.choices(ingredient_ids, weights=weights, k=size)):
+                    yield u, ingredient_id
+
+        copy_rows(cursor, "user_ingredient", ["user_id", "ingredient_id"], pantries())
+
+        for table in ("ingredient", "recipe", "product", "user"):
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM \"{table}\"));"
+            )
+        cursor.execute("ANALYZE;")
+
+    connection.commit()
+    print(f"✓ Seeded {recipes} recipes, {ingredients} ingredients, {users} users "
+          f"in {time.perf_counter() - started:.1f}s")
+    return device_ids
+
+
+class QueryCounter:
+    """Counts statements executed through connections made by `connect`."""
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.count = 0
+        self.lock = threading.Lock()
+        self.cursor_classes = {}
+
+    def _cursor_class(self, base):
+        if base not in self.cursor_classes:
+            counter = self
+
+            class CountingCursor(base):
+                def execute(self, query, vars=None):
+                    with counter.lock:
+                        counter.count += 1
+                    return super().execute(query, vars)
+
+            self.cursor_classes[base] = CountingCursor
+        return self.cursor_classes[base]
+
+    def connect(self):
+        counter = self
+
+        class CountingConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.pop("cursor_factory", None) or self.cursor_factory or psycopg2.extensions.cursor
+                return super().cursor(*args, cursor_factory=counter._cursor_class(base), **kwargs)
+
+        return psycopg2.connect(self.dsn, connection_factory=CountingConnection)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(client, counter, name, make_request, iterations, warmup=5):
+    """Time `make_request()` and report latency percentiles, queries and allocations."""
+    for _ in range(warmup):
+        make_request()
+
+    latencies = []
+    queries = []
+    for _ in range(iterations):
+        counter.count = 0
+        started = time.perf_counter()
+        response = make_request()
+        latencies.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} failed: {response.status_code} {response.text[:200]}")
+
+    # Allocations are measured in a separate pass; tracing slows everything down
+    peaks = []
+    blocks = []
+    for _ in range(max(1, iterations // 10)):
+        tracemalloc.start()
+        before_blocks = sys.getallocatedblocks()
+        make_request()
+        peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+        blocks.append(sys.getallocatedblocks() - before_blocks)
+        tracemalloc.stop()
+
+    latencies.sort()
+    result = {
+        "requests": iterations,
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "mean_ms": round(statistics.fmean(latencies), 3),
+        "queries_per_request": round(statistics.fmean(queries), 2),
+        "alloc_peak_kib": round(statistics.fmean(peaks), 1),
+        "alloc_net_blocks": round(statistics.fmean(blocks), 1),
+    }
+    print(f"  {name:<24} p50={result['p50_ms']:>8.2f}ms p95={result['p95_ms']:>8.2f}ms "
+          f"p99={result['p99_ms']:>8.2f}ms queries={result['queries_per_request']:>5} "
+          f"alloc={result['alloc_peak_kib']:>9.1f}KiB")
+    return result
+
+
+def run(dsn, iterations, device_ids, ingredients, rng, use_cache=False):
+    """Drive each endpoint through the app and return per-endpoint stats."""
+    from fastapi.testclient import TestClient
+    import api
+    from cache import MemoryCache
+
+    counter = QueryCounter(dsn)
+    api.get_db_connection = counter.connect
+    if not use_cache:
+        # Nothing is kept: every lookup misses and every request is computed
+        api.cache = MemoryCache(max_entries=0)
+    client = TestClient(api.app)
+
+    def pick_device():
+        return rng.choice(device_ids)
+
+    results = {
+        "get_recipes": measure(
+            client, counter, "GET /recipes/{device}",
+            lambda: client.get(f"/recipes/{pick_device()}"), iterations,
+        ),
+        "get_user_ingredients": measure(
+            client, counter, "GET /ingredients/{device}",
+            lambda: client.get(f"/ingredients/{pick_device()}"), iterations,
+        ),
+        "add_user_ingredients": measure(
+            client, counter, "POST /ingredients/{device}",
+            lambda: client.post(
+                f"/ingredients/{pick_device()}",
+                json=rng.sample(range(1, ingredients + 1), min(5, ingredients)),
+            ),
+            iterations,
+        ),
+    }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(old_path, new_path):
+    """Print the relative change of every metric between two result files."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"{old['commit']} -> {new['commit']}")
+    if old["params"].get("cache", False) != new["params"].get("cache", False):
+        print("⚠ One run kept the response caches on (--cache); latencies are not comparable")
+    for endpoint, new_stats in new["endpoints"].items():
+        old_stats = old["endpoints"].get(endpoint)
+        if not old_stats:
+            continue
+        print(f"  {endpoint}")
+        for metric, value in new_stats.items():
+            before = old_stats.get(metric)
+            if metric == "requests" or not before:
+                continue
+            change = (value - before) / before * 100
+            flag = "⚠" if metric != "alloc_net_blocks" and change > 10 else " "
+            print(f"   {flag} {metric:<20} {before:>10} -> {value:>10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--ingredients", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--pantry-size", type=int, default=None,
+                        help="fixed pantry size; default samples the real distribution")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the data already in the database")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--force", action="store_true")
+    parser.add_argument("--cache", action="store_true", help="keep the API's response caches on")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    if not args.dsn:
+        parser.error("--dsn or BENCH_DATABASE_URL is required")
+
+    connection = psycopg2.connect(args.dsn)
+    if connection.info.dbname == "cocina" and not args.force:
+        parser.error("refusing to truncate the 'cocina' database; use a scratch database or --force")
+
+    rng = random.Random(args.seed)
+    if args.no_seed:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT device_id FROM "user";')
+            device_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT MAX(id) FROM ingredient;")
+            args.ingredients = cursor.fetchone()[0]
+    else:
+        device_ids = seed(connection, args.recipes, args.ingredients, args.users, args.pantry_size, rng=rng)
+    connection.close()
+
+    print(f"Benchmarking at commit {git_commit()}")
+    endpoints = run(args.dsn, args.iterations, device_ids, args.ingredients, rng, use_cache=args.cache)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {
+            "recipes": args.recipes,
+            "ingredients": args.ingredients,
+            "users": args.users,
+            "pantry_size": args.pantry_size,
+            "iterations": args.iterations,
+            "seed": args.seed,
+            "cache": args.cache,
+        },
+        "endpoints": endpoints,
+    }
+
+    out = args.out or f"bench_results/{report['commit']}.json"
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results saved to {out}")
+
+
+if __name__ == "__main__":
+    main()
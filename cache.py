@@ -0,0 +1,287 @@
+"""
+Cache used by the API.
+
+Entries live in namespaces ("catalog", "recipes", ...). Each namespace has a
+version that is part of every key, so `invalidate(namespace)` drops all of
+its entries at once by bumping the version; old entries are never read
+again and age out of the LRU or expire in the shared store.
+
+Backends, chosen with CACHE_URL:
+- unset or memory:// : MemoryCache, a size-bounded LRU with per-entry TTL in
+  this process (CACHE_MAX_ENTRIES entries).
+- redis://host:port/db : RedisCache, shared by every worker and instance.
+  Works with any Redis-protocol server; needs the `redis` package. Values
+  are stored as JSON.
+
+Concurrent `get_or_set()` misses of the same key in one process share a
+single compute() call (SingleFlight); the waiting callers are counted as
+"coalesced".
+
+Hits, misses, sets, evictions, invalidations, coalesced calls and backend
+errors (treated as misses) are counted per namespace (`stats()`, and
+cache_operations_total in /metrics).
+
+Usage:
+    python cache.py --invalidate search recipes    # e.g. after db.py reloads
+    python cache.py --stats
+"""
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import os
+import sys
+import threading
+import time
+import metrics
+
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "cocina")
+
+CACHE_OPERATIONS = metrics.Counter(
+    "cache_operations_total", "Cache lookups and writes by namespace and result",
+    labels=("namespace", "result"),
+)
+
+MISSING = object()
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time: callers arriving while a call for
+    their key is in flight wait for it and get its result (or exception).
+    """
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.value = None
+            self.error = None
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, compute):
+        """(compute()'s result, whether it came from another caller's call)."""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = compute()
+            return call.value, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+class Cache:
+    """
+    Namespaced, versioned cache. Backends implement _get, _set, _version
+    and _bump_version; values must be treated as read-only.
+    """
+
+    def __init__(self, prefix=CACHE_PREFIX):
+        self.prefix = prefix
+        self.counts = {}
+        self.counts_lock = threading.Lock()
+        self.flights = SingleFlight()
+
+    def count(self, namespace, result, amount=1):
+        with self.counts_lock:
+            counts = self.counts.setdefault(namespace, {})
+            counts[result] = counts.get(result, 0) + amount
+        CACHE_OPERATIONS.inc(namespace, result, amount=amount)
+
+    def full_key(self, namespace, key, version):
+        return f"{self.prefix}:{namespace}:v{version}:{key}"
+
+    def version_key(self, namespace):
+        return f"{self.prefix}:{namespace}:version"
+
+    def get(self, namespace, key, default=None):
+        try:
+            value = self._get(self.full_key(namespace, key, self._version(namespace)))
+        except Exception:
+            # An unreachable shared store degrades to a miss, never to a failed request
+            self.count(namespace, "error")
+            return default
+        if value is MISSING:
+            self.count(namespace, "miss")
+            return default
+        self.count(namespace, "hit")
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        """Store value for ttl seconds (None: until evicted or invalidated)."""
+        try:
+            self._set(namespace, self.full_key(namespace, key, self._version(namespace)), value, ttl)
+        except Exception:
+            self.count(namespace, "error")
+            return
+        self.count(namespace, "set")
+
+    def invalidate(self, namespace):
+        """Drop every entry of the namespace."""
+        self._bump_version(namespace)
+        self.count(namespace, "invalidation")
+
+    def get_or_set(self, namespace, key, compute, ttl=None):
+        """The cached value, else compute() stored for ttl seconds; concurrent misses share one call."""
+        value = self.get(namespace, key, MISSING)
+        if value is not MISSING:
+            return value
+
+        def compute_and_set():
+            value = compute()
+            self.set(namespace, key, value, ttl)
+            return value
+
+        value, coalesced = self.flights.do((namespace, key), compute_and_set)
+        if coalesced:
+            self.count(namespace, "coalesced")
+        return value
+
+    def stats(self):
+        with self.counts_lock:
+            return {
+                "backend": type(self).__name__,
+                "namespaces": {namespace: dict(counts) for namespace, counts in self.counts.items()},
+            }
+
+
+class MemoryCache(Cache):
+    """In-process LRU with per-entry expiry; one copy per worker process."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, prefix=CACHE_PREFIX):
+        super().__init__(prefix)
+        self.max_entries = max_entries
+        # full key -> (value, expires at or None, namespace), least recently used first
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def _get(self, full_key):
+        with self.lock:
+            entry = self.entries.get(full_key)
+            if entry is None:
+                return MISSING
+            value, expires, _ = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.entries[full_key]
+                return MISSING
+            self.entries.move_to_end(full_key)
+            return value
+
+    def _set(self, namespace, full_key, value, ttl):
+        expires = time.monotonic() + ttl if ttl else None
+        evicted = []
+        with self.lock:
+            self.entries[full_key] = (value, expires, namespace)
+            self.entries.move_to_end(full_key)
+            while len(self.entries) > self.max_entries:
+                evicted.append(self.entries.popitem(last=False)[1][2])
+        for evicted_namespace in evicted:
+            self.count(evicted_namespace, "eviction")
+
+    def _version(self, namespace):
+        return self.versions.get(namespace, 0)
+
+    def _bump_version(self, namespace):
+        with self.lock:
+            self.versions[namespace] = self.versions.get(namespace, 0) + 1
+
+    def stats(self):
+        stats = super().stats()
+        stats["entries"] = len(self.entries)
+        stats["max_entries"] = self.max_entries
+        return stats
+
+
+def to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+
+class RedisCache(Cache):
+    """
+    Cache in a Redis-protocol server, shared across processes. `client` is a
+    redis.Redis (or any object with the same get/set/incr/info
+    methods, e.g. a local stand-in).
+    """
+
+    def __init__(self, client, prefix=CACHE_PREFIX):
+        super().__init__(prefix)
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url, prefix=CACHE_PREFIX):
+        import redis
+
+        return cls(redis.Redis.from_url(url, socket_timeout=0.5), prefix)
+
+    def _get(self, full_key):
+        raw = self.client.get(full_key)
+        if raw is None:
+            return MISSING
+        return json.loads(raw)
+
+    def _set(self, namespace, full_key, value, ttl):
+        self.client.set(full_key, json.dumps(value, default=to_json), ex=int(ttl) if ttl else None)
+
+    def _version(self, namespace):
+        version = self.client.get(self.version_key(namespace))
+        return int(version) if version is not None else 0
+
+    def _bump_version(self, namespace):
+        self.client.incr(self.version_key(namespace))
+
+    def stats(self):
+        stats = super().stats()
+        # The server evicts on its own (maxmemory-policy); report its counters
+        try:
+            info = self.client.info("stats")
+        except Exception:
+            stats["server"] = None
+            return stats
+        stats["server"] = {key: info.get(key) for key in ("keyspace_hits", "keyspace_misses", "evicted_keys", "expired_keys")}
+        return stats
+
+
+def from_url(url):
+    if not url or url.startswith("memory://"):
+        return MemoryCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache.from_url(url)
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+cache = from_url(CACHE_URL)
+
+
+if __name__ == "__main__":
+    if "--invalidate" in sys.argv:
+        if isinstance(cache, MemoryCache):
+            print("⚠ CACHE_URL is not set; an in-process cache cannot be invalidated from here")
+        for namespace in sys.argv[sys.argv.index("--invalidate") + 1:]:
+            cache.invalidate(namespace)
+            print(f"✓ Invalidated {namespace}")
+    elif "--stats" in sys.argv:
+        print(json.dumps(cache.stats(), indent=2))
@@ -0,0 +1,472 @@
+"""
+Read-only catalog snapshot shared by every API worker process.
+
+The catalog (ingredients, recipes with their ingredient lists, products)
+is written once per catalog version into a compact file of typed arrays:
+one fixed-width array per column, int lists as offsets into one values
+array, and strings as indexes into an interned string table (offsets plus
+one UTF-8 blob). Rows are sorted by id, so a lookup is a bisect; values
+are decoded only when a row is read.
+
+The file lives in a directory per database under CATALOG_SNAPSHOT_DIR
+(default /dev/shm/cocina, a shared-memory filesystem), so databases on the
+same host never attach or remove each other's snapshots, and is mmap'ed
+read-only, so every worker reads the same pages and memory does not grow
+with the worker count.
+
+catalog_version (migration 14) is bumped by triggers on every catalog
+change. Workers poll it (`start_background_refresh()`); the first one to
+see a new version writes its snapshot under a file lock, the others wait
+and attach to the same file. Swapping is replacing one reference: requests
+still holding the previous snapshot finish with it.
+
+Files carry a CRC32 of everything after the header, checked on attach.
+An exported snapshot (CATALOG_EXPORT_PATH, written at build time) lets a
+new instance start without reading the catalog tables: if its version is
+the database's, it is copied into the shared directory instead.
+
+Usage:
+    python catalog.py                       # write the snapshot of the current version
+    python catalog.py --export [path]       # export it (default CATALOG_EXPORT_PATH);
+                                            # skipped if the database is not migrated yet
+"""
+from array import array
+from bisect import bisect_left
+import fcntl
+import hashlib
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+import psycopg2
+
+CATALOG_SNAPSHOT_DIR = os.getenv(
+    "CATALOG_SNAPSHOT_DIR",
+    "/dev/shm/cocina" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "cocina"),
+)
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "5"))
+CATALOG_EXPORT_PATH = os.getenv(
+    "CATALOG_EXPORT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog.bin"),
+)
+
+MAGIC = b"COCINACT"
+FORMAT_VERSION = 2
+# magic, format version, catalog version, section count, CRC32 of the rest
+HEADER = struct.Struct("<8sIQII")
+# section name, offset, length in bytes
+SECTION = struct.Struct("<32sQQ")
+ALIGNMENT = 8
+
+NULL_INT = -(2 ** 31)
+NULL_STRING = -1
+
+# Column types: int (int32), float (float64), str (string table index), ints (int list)
+TABLES = {
+    "ingredient": [("id", "int"), ("name", "str"), ("name_es", "str"), ("img_url", "str"), ("product_ids", "ints")],
+    "recipe": [
+        ("id", "int"), ("name", "str"), ("minutes", "int"), ("rating", "float"), ("instructions", "str"),
+        ("img_url", "str"), ("video_url", "str"), ("name_es", "str"), ("instructions_es", "str"),
+        ("ingredient_ids", "ints"),
+    ],
+    "product": [("id", "int"), ("name", "str"), ("price", "int"), ("url", "str"), ("ingredient_id", "int")],
+}
+
+QUERIES = {
+    "ingredient": """
+        SELECT i.id, i.name, i.name_es, i.img_url,
+               COALESCE(array_agg(p.id ORDER BY p.id) FILTER (WHERE p.id IS NOT NULL), '{}') AS product_ids
+        FROM ingredient i
+        LEFT JOIN product p ON p.ingredient_id = i.id AND p.removed_at IS NULL
+        GROUP BY i.id
+        ORDER BY i.id;
+    """,
+    "recipe": """
+        SELECT id, name, minutes, rating, instructions, img_url, video_url, name_es, instructions_es, ingredient_ids
+        FROM recipe
+        ORDER BY id;
+    """,
+    "product": "SELECT id, name, price, url, ingredient_id FROM product WHERE removed_at IS NULL ORDER BY id;",
+}
+
+
+def database_directory(connection, base=CATALOG_SNAPSHOT_DIR):
+    """Snapshot directory of the database `connection` is on: its name and a hash of host, port and name."""
+    info = connection.info
+    identity = f"{info.host}:{info.port}/{info.dbname}"
+    return os.path.join(base, f"{info.dbname}-{hashlib.sha1(identity.encode()).hexdigest()[:12]}")
+
+
+def snapshot_path(directory, version):
+    return os.path.join(directory, f"catalog-{version}.bin")
+
+
+def encode(version, tables):
+    """Snapshot bytes of {table: rows as tuples in TABLES column order}."""
+    strings = {}
+    sections = []
+
+    def intern(value):
+        if value is None:
+            return NULL_STRING
+        return strings.setdefault(value, len(strings))
+
+    for table, columns in TABLES.items():
+        rows = tables[table]
+        for position, (column, kind) in enumerate(columns):
+            values = [row[position] for row in rows]
+            name = f"{table}.{column}"
+            if kind == "int":
+                sections.append((name, array("i", [NULL_INT if v is None else v for v in values])))
+            elif kind == "float":
+                sections.append((name, array("d", [math.nan if v is None else v for v in values])))
+            elif kind == "str":
+                sections.append((name, array("i", [intern(v) for v in values])))
+            else:
+                offsets = array("I", [0])
+                flat = array("i")
+                for v in values:
+                    flat.extend(v or [])
+                    offsets.append(len(flat))
+                sections.append((name + ".offsets", offsets))
+                sections.append((name + ".values", flat))
+
+    blobs = [s.encode() for s in strings]
+    offsets = array("I", [0])
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    sections.append(("strings.offsets", offsets))
+    sections.append(("strings.data", b"".join(blobs)))
+
+    payload = [bytes(data) for _, data in sections]
+    position = HEADER.size + SECTION.size * len(sections)
+    directory = []
+    for (name, _), data in zip(sections, payload):
+        position += -position % ALIGNMENT
+        directory.append(SECTION.pack(name.encode(), position, len(data)))
+        position += len(data)
+
+    parts = directory
+    written = HEADER.size + SECTION.size * len(sections)
+    for data in payload:
+        parts.append(b"\0" * (-written % ALIGNMENT))
+        written += -written % ALIGNMENT
+        parts.append(data)
+        written += len(data)
+    body = b"".join(parts)
+    return HEADER.pack(MAGIC, FORMAT_VERSION, version, len(sections), zlib.crc32(body)) + body
+
+
+def read_catalog(connection):
+    """(catalog version, {table: rows}) read in one consistent transaction."""
+    connection.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT version FROM catalog_version;")
+            version = cursor.fetchone()[0]
+            tables = {}
+            for table, query in QUERIES.items():
+                cursor.execute(query)
+                tables[table] = cursor.fetchall()
+    finally:
+        connection.rollback()
+        connection.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+    return version, tables
+
+
+def write_file(path, data):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    # Readers only ever open complete files
+    os.replace(temporary, path)
+
+
+def write_snapshot(connection, directory=None):
+    """Write the snapshot of the current catalog version (default: in its database directory); returns its path."""
+    version, tables = read_catalog(connection)
+    directory = directory or database_directory(connection)
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory, version)
+    write_file(path, encode(version, tables))
+    return path
+
+
+def export(connection, path=CATALOG_EXPORT_PATH):
+    """Write the snapshot of the current catalog version to path; returns the version."""
+    version, tables = read_catalog(connection)
+    write_file(path, encode(version, tables))
+    return version
+
+
+class Table:
+    """Column views of one table in a snapshot."""
+
+    def __init__(self, snapshot, name):
+        # column -> function reading its value at a row index
+        self.readers = {}
+        for column, kind in TABLES[name]:
+            key = f"{name}.{column}"
+            if kind == "ints":
+                self.readers[column] = self.int_list_reader(snapshot.array(key + ".offsets", "I"), snapshot.array(key + ".values", "i"))
+            elif kind == "str":
+                self.readers[column] = self.string_reader(snapshot.array(key, "i"), snapshot.string)
+            elif kind == "float":
+                self.readers[column] = self.float_reader(snapshot.array(key, "d"))
+            else:
+                self.readers[column] = self.int_reader(snapshot.array(key, "i"))
+        self.ids = snapshot.array(f"{name}.id", "i")
+
+    @staticmethod
+    def int_reader(values):
+        return lambda row: None if values[row] == NULL_INT else values[row]
+
+    @staticmethod
+    def float_reader(values):
+        return lambda row: None if math.isnan(values[row]) else values[row]
+
+    @staticmethod
+    def string_reader(indexes, string):
+        return lambda row: string(indexes[row])
+
+    @staticmethod
+    def int_list_reader(offsets, values):
+        return lambda row: values[offsets[row]:offsets[row + 1]].tolist()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, id):
+        """Row index of id, or None."""
+        row = bisect_left(self.ids, id)
+        if row < len(self.ids) and self.ids[row] == id:
+            return row
+        return None
+
+    def value(self, row, column):
+        return self.readers[column](row)
+
+    def row(self, row, columns):
+        readers = self.readers
+        return {column: readers[column](row) for column in columns}
+
+
+class Snapshot:
+    """A catalog snapshot file, mapped read-only."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if len(self.view) < HEADER.size:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        magic, format_version, self.version, count, checksum = HEADER.unpack_from(self.view)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a catalog snapshot (format {FORMAT_VERSION})")
+        if zlib.crc32(self.view[HEADER.size:]) != checksum:
+            raise ValueError(f"{path} is corrupt (checksum mismatch)")
+        self.sections = {}
+        for i in range(count):
+            name, offset, length = SECTION.unpack_from(self.view, HEADER.size + i * SECTION.size)
+            self.sections[name.rstrip(b"\0").decode()] = (offset, length)
+
+        self.string_offsets = self.array("strings.offsets", "I")
+        self.string_data = self.array("strings.data", "B")
+        self.tables = {name: Table(self, name) for name in TABLES}
+
+    def array(self, name, typecode):
+        offset, length = self.sections[name]
+        return self.view[offset:offset + length].cast(typecode)
+
+    def string(self, index):
+        if index == NULL_STRING:
+            return None
+        return str(self.string_data[self.string_offsets[index]:self.string_offsets[index + 1]], "utf-8")
+
+    def ingredients(self, columns=("id", "name", "name_es", "img_url")):
+        table = self.tables["ingredient"]
+        return [table.row(row, columns) for row in range(len(table))]
+
+    def ingredient(self, id, columns=("id", "name", "name_es", "img_url")):
+        table = self.tables["ingredient"]
+        row = table.find(id)
+        return None if row is None else table.row(row, columns)
+
+    def recipe(self, id):
+        """Recipe as a dict, with its ingredient ids in recipe order."""
+        table = self.tables["recipe"]
+        row = table.find(id)
+        return None if row is None else table.row(row, [column for column, _ in TABLES["recipe"]])
+
+    def recipe_uses(self):
+        """{ingredient id: number of recipes using it}."""
+        table = self.tables["recipe"]
+        uses = {}
+        for row in range(len(table)):
+            for ingredient_id in table.value(row, "ingredient_ids"):
+                uses[ingredient_id] = uses.get(ingredient_id, 0) + 1
+        return uses
+
+    def products_for(self, ingredient_id):
+        """Products of an ingredient, by id."""
+        ingredients, products = self.tables["ingredient"], self.tables["product"]
+        row = ingredients.find(ingredient_id)
+        if row is None:
+            return []
+        columns = [column for column, _ in TABLES["product"]]
+        return [products.row(products.find(id), columns) for id in ingredients.value(row, "product_ids")]
+
+
+class SharedCatalog:
+    """
+    The snapshot of the current catalog version for this process; writes
+    it first if no worker has yet. `connect()` returns a DB connection.
+    `source` tells where the last snapshot came from: "shared" (written by
+    another worker), "export" or "database".
+    """
+
+    def __init__(self, connect, directory=CATALOG_SNAPSHOT_DIR, export_path=CATALOG_EXPORT_PATH):
+        self.connect = connect
+        self.base_directory = directory
+        # Known once connected: database_directory() under base_directory
+        self.directory = None
+        self.export_path = export_path
+        self.snapshot = None
+        self.source = None
+        self.lock = threading.Lock()
+
+    def attach(self, version):
+        path = snapshot_path(self.directory, version)
+        try:
+            snapshot = Snapshot(path)
+            self.source = "shared"
+            return snapshot
+        except FileNotFoundError:
+            # Not written yet, or removed by a newer worker after our
+            # version check; build it under the lock below.
+            pass
+        except ValueError as e:
+            print(f"⚠ Rewriting the catalog snapshot: {e}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "catalog.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(path):
+                self.source = "shared"
+            elif self.copy_export(version, path):
+                self.source = "export"
+                self.remove_older(path)
+            else:
+                connection = self.connect()
+                try:
+                    path = write_snapshot(connection, self.directory)
+                finally:
+                    connection.close()
+                self.source = "database"
+                self.remove_older(path)
+            # Open while still holding the lock: once it is released another
+            # worker may write a newer snapshot and remove this one.
+            return Snapshot(path)
+
+    def copy_export(self, version, path):
+        """Copy the exported snapshot to path if it is intact and of `version`."""
+        if not self.export_path or not os.path.exists(self.export_path):
+            return False
+        try:
+            exported = Snapshot(self.export_path)
+        except ValueError as e:
+            print(f"⚠ Ignoring the catalog export: {e}")
+            return False
+        if exported.version != version:
+            print(f"⚠ Catalog export is stale (version {exported.version}, database {version})")
+            return False
+        write_file(path, exported.map[:])
+        return True
+
+    def remove_older(self, current):
+        # Workers still mapping an old file keep reading it until they swap
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith("catalog-") and name.endswith(".bin") and path != current:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def current_version(self):
+        connection = self.connect()
+        try:
+            if self.directory is None:
+                self.directory = database_directory(connection, self.base_directory)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT version FROM catalog_version;")
+                return cursor.fetchone()[0]
+        finally:
+            connection.close()
+
+    def refresh(self):
+        """Swap to the snapshot of the current catalog version if it changed."""
+        with self.lock:
+            version = self.current_version()
+            if self.snapshot is None or self.snapshot.version != version:
+                self.snapshot = self.attach(version)
+            return self.snapshot
+
+    def get(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            snapshot = self.refresh()
+        return snapshot
+
+
+def start_background_refresh(catalog, interval=CATALOG_REFRESH_INTERVAL):
+    """Daemon thread calling catalog.refresh() every `interval` seconds; None if disabled."""
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                catalog.refresh()
+            except Exception as e:
+                print(f"⚠ Catalog snapshot refresh failed: {e}")
+
+    thread = threading.Thread(target=loop, name="catalog-snapshot", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    from migrations import get_connection
+
+    conn = get_connection()
+    try:
+        if "--export" in sys.argv:
+            arguments = sys.argv[sys.argv.index("--export") + 1:]
+            path = arguments[0] if arguments else CATALOG_EXPORT_PATH
+            try:
+                version = export(conn, path)
+                print(f"✓ Exported catalog version {version} to {path} ({os.path.getsize(path) / 1024:.0f} KiB)")
+            except (psycopg2.errors.UndefinedTable, psycopg2.errors.UndefinedColumn) as e:
+                # The build runs before the pre-deploy migrations: a schema they
+                # have not reached yet just means no export this deploy, and
+                # instances write their snapshot from the database instead.
+                print(f"⚠ Skipping the catalog export, the database is not migrated yet: {e}")
+        else:
+            path = write_snapshot(conn)
+            print(f"✓ Wrote {path} ({os.path.getsize(path) / 1024:.0f} KiB)")
+    except psycopg2.Error as e:
+        print(f"✗ Error writing the catalog snapshot: {e}")
+        # Fail the build rather than deploy without a snapshot
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -1,7 +1,12 @@
 import asyncio
-import subprocess
+import hashlib
+import json
+import os
+import sys
 import time
+from urllib.parse import urlsplit
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig
+from products import diff_products, extract_products, undo_diff
 
 # List of URLs to crawl
 urls = [
@@ -15,24 +20,170 @@ crawler_conf = CrawlerRunConfig(
     wait_for="css:.shelf-content"
 )
 
+# Politeness: requests in flight and seconds between request starts, per host
+MAX_CONCURRENT_PER_HOST = 2
+DELAY_PER_HOST = 3
+
+# Safety cap for pagination within a category
+MAX_PAGES = 50
+
+# Text present once per product card; a page without it is past the last page
+PRODUCT_MARKER = "Agregar a Mis listas"
+
+
+class HostLimiter:
+    """Limit concurrency and request rate per host without blocking the event loop."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_PER_HOST, delay=DELAY_PER_HOST):
+        self.max_concurrent = max_concurrent
+        self.delay = delay
+        self.semaphores = {}
+        self.locks = {}
+        self.next_start = {}
+
+    async def acquire(self, url):
+        host = urlsplit(url).netloc
+        semaphore = self.semaphores.setdefault(host, asyncio.Semaphore(self.max_concurrent))
+        lock = self.locks.setdefault(host, asyncio.Lock())
+
+        await semaphore.acquire()
+        # Space out request starts to the same host
+        async with lock:
+            wait = self.next_start.get(host, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.next_start[host] = time.monotonic() + self.delay
+        return semaphore
+
+
+def page_url(url, page):
+    return url if page == 1 else f"{url}?page={page}"
+
+
+async def fetch(crawler, limiter, url):
+    semaphore = await limiter.acquire(url)
+    try:
+        started = time.perf_counter()
+        result = await crawler.arun(url=url, config=crawler_conf)
+    finally:
+        semaphore.release()
+
+    if result is None or not result.success:
+        raise ValueError(f"Crawl failed: {url}")
+
+    print(f"✓ Crawled {url} in {time.perf_counter() - started:.1f}s")
+    return result.markdown
+
+
+def load_manifest(category):
+    """
+    Previous crawl state of a category: {page_url: {"hash": ..., "products": [...]}}.
+    """
+    try:
+        with open(f"data/{category}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def load_pending_diff(category):
+    """Diff written by an earlier run that load_product_diff has not consumed yet."""
+    try:
+        with open(f"data/{category}.diff.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_json(path, data):
+    # Write then rename so an interrupted run never leaves a truncated file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+async def crawl_category(crawler, limiter, url):
+    """
+    Crawl every page of a category. Only pages whose content hash changed
+    since the last run are re-parsed; if anything changed, data/{category}.md,
+    the manifest data/{category}.json and the product diff
+    data/{category}.diff.json are rewritten. The diff stays pending until
+    db.load_product_diff consumes it.
+    """
+    category = url.split('/')[-1]
+    previous = load_manifest(category)
+    manifest = {}
+    pages = []
+    changed_pages = 0
+
+    for page in range(1, MAX_PAGES + 1):
+        current_url = page_url(url, page)
+        markdown = await fetch(crawler, limiter, current_url)
+        # Out-of-range pages render empty or repeat the last page
+        if PRODUCT_MARKER not in markdown or (pages and markdown == pages[-1]):
+            break
+        pages.append(markdown)
+
+        digest = hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+        entry = previous.get(current_url)
+        if entry and entry["hash"] == digest:
+            manifest[current_url] = entry
+        else:
+            manifest[current_url] = {"hash": digest, "products": extract_products(markdown)}
+            changed_pages += 1
+
+    if not changed_pages and manifest.keys() == previous.keys():
+        print(f"✓ {category} unchanged ({len(pages)} pages), skipping")
+        return category, len(pages), None
+
+    previous_products = [p for entry in previous.values() for p in entry["products"]]
+    pending = load_pending_diff(category)
+    if pending:
+        previous_products = undo_diff(previous_products, pending)
+    current_products = [p for entry in manifest.values() for p in entry["products"]]
+    diff = diff_products(previous_products, current_products)
+
+    with open(f"data/{category}.md", "w", encoding="utf-8") as f:
+        f.write("\n\n".join(pages))
+    save_json(f"data/{category}.diff.json", diff)
+    save_json(f"data/{category}.json", manifest)
+
+    print(
+        f"✓ Saved {category}: {len(pages)} pages ({changed_pages} changed), "
+        f"{len(diff['new'])} new, {len(diff['removed'])} removed, "
+        f"{len(diff['price_changed'])} price changes"
+    )
+    return category, len(pages), diff
+
+
 async def main():
-    for url in urls:
-        async with AsyncWebCrawler() as crawler:
-            result = await crawler.arun(
-                url=url,
-                config=crawler_conf
-            )
-
-        if (result is None):
-            raise ValueError("Crawl failed")
-
-        category = url.split('/')[-1]
-        
-        with open(f"data/{category}.md", "w", encoding="utf-8") as f:
-            f.write(result.markdown)
-        
-        time.sleep(3)
+    started = time.perf_counter()
+    limiter = HostLimiter()
 
-if __name__ == '__main__':
-    asyncio.run(main())
+    # One browser for the whole run; categories share it concurrently. A
+    # failing category is reported and the others carry on: its files are
+    # only written once it completes, so its last good state stays in place.
+    async with AsyncWebCrawler() as crawler:
+        results = await asyncio.gather(
+            *(crawl_category(crawler, limiter, url) for url in urls),
+            return_exceptions=True,
+        )
+
+    crawled, failed = [], []
+    for url, result in zip(urls, results):
+        if isinstance(result, BaseException):
+            print(f"✗ Error crawling {url}: {result!r}")
+            failed.append(url)
+        else:
+            crawled.append(result)
 
+    total_pages = sum(pages for _, pages, _ in crawled)
+    print(f"✓ Crawled {total_pages} pages in {time.perf_counter() - started:.1f}s")
+    if failed:
+        print(f"⚠ {len(failed)} of {len(urls)} categories failed")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -4,14 +4,19 @@ todo:
 - Handle nullability
 '''
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+import csv
 import json
+import os
 import random
-import re
 import requests
 import time
 import psycopg2
-from psycopg2 import OperationalError
+from psycopg2 import OperationalError, sql
+from psycopg2.extras import execute_values
 from langchain_google_genai import ChatGoogleGenerativeAI
+from matcher import IngredientMatcher
+from products import stream_products
 
 load_dotenv()
 
@@ -117,6 +122,7 @@ def create_tables():
                 price INTEGER NOT NULL,
                 url TEXT NOT NULL,
                 ingredient_id INTEGER,
+                match_confidence REAL,
                 FOREIGN KEY (ingredient_id) REFERENCES ingredient(id) ON DELETE SET NULL
             );
         """)
@@ -277,7 +283,175 @@ def load_recipes():
         print(f"✗ Database error: {e}")
 
 
-def load_products(markdown_file):
+PRODUCT_MATCH_PROMPT = """
+- The user will provide you with a list of ingredients from a recipe database (in English) and a list of product names 
+(in Spanish).
+- Your task is to match each product name to the most relevant ingredient from the database.
+- Return ONLY valid JSON list in this exact format: [{"name": "product1", "ingredient_id": 123, "confidence": 0.8}, ...]
+- "confidence" is how sure you are of the match, from 0 to 1.
+- If no suitable match is found for a product, don't include that product in the returned list.
+- Do not include any explanations, markdown formatting, or additional text.
+"""
+
+
+def parse_llm_json(content):
+    """Strip markdown fences from an LLM response and parse it as JSON."""
+    content = content.strip()
+    if content.startswith("```json"):
+        content = content.replace("```json", "").replace("```", "").strip()
+    elif content.startswith("```"):
+        content = content.replace("```", "").strip()
+    return json.loads(content)
+
+
+def match_products_chunk(llm, ingredients, chunk):
+    """
+    Ask the LLM to match one chunk of products against the ingredient dict.
+    Returns (matches, usage_metadata).
+    """
+    product_names = [{'name': product['name'], 'ingredient_id': ''} for product in chunk]
+
+    messages = [
+        ("system", PRODUCT_MATCH_PROMPT),
+        (
+            "human",
+            f"""
+- Ingredients (format: name: id):
+{ingredients}
+
+
+- Products to match:
+{product_names}
+            """
+        ),
+    ]
+
+    ai_msg = llm.invoke(messages)
+    usage = getattr(ai_msg, 'usage_metadata', None) or {}
+
+    if not ai_msg.content:
+        raise ValueError(f"Empty AI response (usage: {usage})")
+
+    return parse_llm_json(ai_msg.content), usage
+
+
+def match_products(products, ingredients, chunk_size=40, max_concurrency=4, max_attempts=3):
+    """
+    Match products to ingredient ids in parallel chunks.
+
+    Products are split into chunks of `chunk_size` and sent to the LLM with at
+    most `max_concurrency` calls in flight. A failed chunk (timeout, truncated
+    or invalid JSON) is retried on its own up to `max_attempts` times; if it
+    still fails its products are left unmatched instead of losing the whole file.
+    Timing and token usage are printed per chunk.
+    """
+    if not products:
+        return []
+
+    llm = ChatGoogleGenerativeAI(
+        model="gemini-2.5-flash",
+        temperature=0,
+        max_tokens=8192,
+        timeout=60,
+        max_retries=0,  # retries are handled per chunk below
+    )
+
+    chunks = [products[i:i + chunk_size] for i in range(0, len(products), chunk_size)]
+
+    def run_chunk(index, chunk):
+        for attempt in range(1, max_attempts + 1):
+            started = time.perf_counter()
+            try:
+                matches, usage = match_products_chunk(llm, ingredients, chunk)
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                print(f"⚠ Chunk {index + 1}/{len(chunks)} attempt {attempt} failed after {elapsed:.1f}s: {e}")
+                if attempt < max_attempts:
+                    time.sleep(2 ** attempt + random.random())
+                continue
+
+            elapsed = time.perf_counter() - started
+            print(
+                f"✓ Chunk {index + 1}/{len(chunks)}: {len(matches)}/{len(chunk)} matched "
+                f"in {elapsed:.1f}s (tokens in={usage.get('input_tokens', '?')}, "
+                f"out={usage.get('output_tokens', '?')})"
+            )
+            return matches, usage
+
+        print(f"✗ Chunk {index + 1}/{len(chunks)} gave up after {max_attempts} attempts")
+        return [], {}
+
+    started = time.perf_counter()
+    matched_products = []
+    input_tokens = 0
+    output_tokens = 0
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [executor.submit(run_chunk, index, chunk) for index, chunk in enumerate(chunks)]
+        for future in futures:
+            matches, usage = future.result()
+            matched_products.extend(matches)
+            input_tokens += usage.get('input_tokens', 0)
+            output_tokens += usage.get('output_tokens', 0)
+
+    print(
+        f"✓ Matched {len(matched_products)}/{len(products)} products in {len(chunks)} chunks "
+        f"({time.perf_counter() - started:.1f}s, tokens in={input_tokens}, out={output_tokens})"
+    )
+    return matched_products
+
+
+def load_ingredient_index(cursor):
+    """
+    Load the ingredient catalog once for product matching.
+    Returns (matcher, ingredients) where ingredients maps lowercase name to id.
+    """
+    # Load all ingredients into memory
+    cursor.execute("SELECT id, name, name_es FROM ingredient;")
+    ingredient_rows = cursor.fetchall()
+    ingredients = {name.lower(): id for id, name, _ in ingredient_rows}
+
+    return IngredientMatcher(ingredient_rows), ingredients
+
+
+def match_ingredients(products, matcher, ingredients):
+    """
+    Set `ingredient_id` and `match_confidence` on each product (None when unmatched).
+    Obvious matches are resolved locally, only the leftovers go to the LLM.
+    Returns the number of matched products.
+    """
+    started = time.perf_counter()
+    local_matches, leftovers = matcher.match_all(products)
+    print(
+        f"✓ Matched {len(local_matches)}/{len(products)} products locally "
+        f"in {(time.perf_counter() - started) * 1000:.1f}ms"
+    )
+
+    # Complete ingredient_id using LLM, one chunk of products per call
+    llm_matches = match_products(leftovers, ingredients)
+    llm_map = {item['name']: item for item in llm_matches}
+
+    for product in leftovers:
+        item = llm_map.get(product['name'], {})
+        product['ingredient_id'] = item.get('ingredient_id')
+        product['match_confidence'] = item.get('confidence')
+
+    return len(local_matches) + len(llm_matches)
+
+
+def batched(iterable, size):
+    """Yield lists of up to `size` items from any iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_products(markdown_file, batch_size=500):
     """
     Load products from frutas-y-verduras.md file and match with ingredients using LLM.
     Example of markdown_file: 'data/frutas-y-verduras.md'
@@ -288,10 +462,6 @@ def load_products(markdown_file):
      - llm params
     """
     try:
-        # Read the markdown file
-        with open(markdown_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-
         # Connect to database
         connection = psycopg2.connect(
             host="localhost",
@@ -302,125 +472,178 @@ def load_products(markdown_file):
 
         cursor = connection.cursor()
 
-        # Load all ingredients into memory
-        cursor.execute("SELECT id, name FROM ingredient;")
-        ingredients = {name.lower(): id for id, name in cursor.fetchall()}
+        matcher, ingredients = load_ingredient_index(cursor)
 
-        products = []
+        # Stream products out of the file and load them batch by batch,
+        # so memory stays flat however large the category page is
+        processed_count = 0
+        matched_count = 0
+        inserted_count = 0
+        for products in batched(stream_products(markdown_file), batch_size):
+            processed_count += len(products)
+            matched_count += match_ingredients(products, matcher, ingredients)
 
-        # # Extract product lines
-        pattern = r'!\[([^\]]+)\].*?Agregar a Mis listas \$([0-9.,]+).*?\]\((https://www.jumbo.cl/[^\)]+)\)'
-        matches = re.finditer(pattern, content, re.IGNORECASE)
+            execute_values(
+                cursor,
+                """
+                INSERT INTO product (name, price, url, ingredient_id, match_confidence)
+                VALUES %s
+                ON CONFLICT DO NOTHING;
+                """,
+                [
+                    (product['name'], product['price'], product['url'],
+                     product['ingredient_id'], product['match_confidence'])
+                    for product in products
+                ],
+                page_size=batch_size,
+            )
+            inserted_count += cursor.rowcount
 
-        for index, match in enumerate(matches):
-            # if index > 10:
-                # continue
+        connection.commit()
+        print(f"✓ Successfully loaded {inserted_count} products into database!")
 
-            product_name = match.group(1).strip().replace('\\', '')
-            price_str = match.group(2).strip().replace('.', '')
-            if not price_str.isdigit():
-                continue
-            price = int(price_str)
-            url = match.group(3).strip()
-            products.append({
-                'name': product_name,
-                'price': price,
-                'url': url,
-            })
+        cursor.close()
+        connection.close()
 
+        return {
+            'products_processed': processed_count,
+            'products_matched': matched_count,
+            'products_inserted': inserted_count,
+            'status': 'success'
+        }
 
-        # Complete ingredient_id using LLM
+    except FileNotFoundError:
+        error_msg = "✗ Error: frutas-y-verduras.md file not found"
+        print(error_msg)
+        return {'status': 'error', 'error': error_msg}
+    except OperationalError as e:
+        error_msg = f"✗ Database error: {e}"
+        print(error_msg)
+        return {'status': 'error', 'error': error_msg}
+    except json.JSONDecodeError as e:
+        error_msg = f"✗ Error parsing LLM response: {e}"
+        print(error_msg)
+        return {'status': 'error', 'error': error_msg}
+    except Exception as e:
+        error_msg = f"✗ Error: {e}"
+        print(error_msg)
+        return {'status': 'error', 'error': error_msg}
 
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-flash",
-            temperature=0,
-            max_tokens=None,  # Remove token limit or set much higher
-            timeout=180,
-            max_retries=3,
+
+def load_product_diff(category):
+    """
+    Apply the product diff written by crawl.py (data/{category}.diff.json):
+    insert and match new products, update changed prices and mark removed
+    products with removed_at, keyed by url. Products that are already in
+    the table (every product on a first run without a manifest) only get
+    their price refreshed and are brought back if they had been removed;
+    they never reach the LLM. Removed products keep their row so their
+    click history survives (product.removed_at, migration 15). The diff
+    file is removed once committed.
+    Example of category: 'frutas-y-verduras'
+    """
+    diff_file = f"data/{category}.diff.json"
+    try:
+        with open(diff_file, 'r', encoding='utf-8') as f:
+            diff = json.load(f)
+
+        connection = psycopg2.connect(
+            host="localhost",
+            database="cocina",
+            user="s7",
+            password="123456"
         )
 
-        product_names = [{'name': product['name'], 'ingredient_id': '' } for product in products]
+        cursor = connection.cursor()
 
-        messages = [
-            (
-                "system",
-                """
-- The user will provide you with a list of ingredients from a recipe database (in English) and a list of product names 
-(in Spanish).
-- Your task is to match each product name to the most relevant ingredient from the database.
-- Return ONLY valid JSON list in this exact format: [{"name": "product1", "ingredient_id": 123}, ...]
-- If no suitable match is found for a product, don't include that product in the returned list.
-- Do not include any explanations, markdown formatting, or additional text.
-                """,
-            ),
-            (
-                "human",
-                f"""
-- Ingredients (format: name: id):
-{ingredients}
+        matcher, ingredients = load_ingredient_index(cursor)
 
+        cursor.execute(
+            "SELECT url FROM product WHERE url = ANY(%s);",
+            ([product['url'] for product in diff['new']],)
+        )
+        known_urls = {row[0] for row in cursor.fetchall()}
+        new_products = [product for product in diff['new'] if product['url'] not in known_urls]
+        known_products = [product for product in diff['new'] if product['url'] in known_urls]
+
+        matched_count = match_ingredients(new_products, matcher, ingredients)
 
-- Products to match:
-{product_names}
-                """
-            ),
-        ]
-
-        ai_msg = llm.invoke(messages)
-        print(f"Response content length: {len(ai_msg.content)}\n")
-        print(f"Response preview: {ai_msg.content[:500]}\n")
-        
-        if not ai_msg.content:
-            print("⚠ Warning: Empty AI response. Check finish_reason in metadata.")
-            print(f"Usage metadata: {ai_msg.usage_metadata if hasattr(ai_msg, 'usage_metadata') else 'N/A'}")
-            return {'status': 'error', 'error': 'Empty AI response'}
-
-        # Parse the LLM response
-        import json
-        matched_products = json.loads(ai_msg.content)
-        
-        # Create a lookup dictionary for matched products
-        product_ingredient_map = {item['name']: item['ingredient_id'] for item in matched_products}
-        
-        # Insert products into database
         inserted_count = 0
-        for product in products:
-            ingredient_id = product_ingredient_map.get(product['name'])
-            
-            cursor.execute(
+        if new_products:
+            inserted = execute_values(
+                cursor,
                 """
-                INSERT INTO product (name, price, url, ingredient_id)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT DO NOTHING;
+                INSERT INTO product (name, price, url, ingredient_id, match_confidence)
+                SELECT v.name, v.price, v.url, v.ingredient_id, v.match_confidence
+                FROM (VALUES %s) AS v (name, price, url, ingredient_id, match_confidence)
+                WHERE NOT EXISTS (SELECT 1 FROM product WHERE product.url = v.url)
+                RETURNING id;
                 """,
-                (product['name'], product['price'], product['url'], ingredient_id)
+                [
+                    (product['name'], product['price'], product['url'],
+                     product['ingredient_id'], product['match_confidence'])
+                    for product in new_products
+                ],
+                template="(%s, %s::integer, %s, %s::integer, %s::real)",
+                fetch=True,
             )
-            if cursor.rowcount > 0:
-                inserted_count += 1
+            inserted_count = len(inserted)
+
+        # Changed prices, and products already loaded (revived if they had been removed)
+        updated_count = 0
+        price_updates = known_products + diff['price_changed']
+        if price_updates:
+            updated = execute_values(
+                cursor,
+                """
+                UPDATE product SET price = v.price, removed_at = NULL
+                FROM (VALUES %s) AS v (url, price)
+                WHERE product.url = v.url
+                  AND (product.price IS DISTINCT FROM v.price OR product.removed_at IS NOT NULL)
+                RETURNING product.id;
+                """,
+                [(product['url'], product['price']) for product in price_updates],
+                template="(%s, %s::integer)",
+                fetch=True,
+            )
+            updated_count = len(updated)
+
+        cursor.execute(
+            """
+            UPDATE product SET removed_at = CURRENT_TIMESTAMP
+            WHERE url = ANY(%s) AND removed_at IS NULL;
+            """,
+            ([product['url'] for product in diff['removed']],)
+        )
+        removed_count = cursor.rowcount
 
         connection.commit()
-        print(f"✓ Successfully loaded {inserted_count} products into database!")
+        os.remove(diff_file)
+        print(
+            f"✓ Applied {category} diff: {inserted_count} inserted ({matched_count} matched), "
+            f"{updated_count} prices updated, {removed_count} removed"
+        )
 
         cursor.close()
         connection.close()
 
         return {
-            'products_processed': len(products),
-            'products_matched': len(matched_products),
             'products_inserted': inserted_count,
+            'products_matched': matched_count,
+            'prices_updated': updated_count,
+            'products_removed': removed_count,
             'status': 'success'
         }
 
     except FileNotFoundError:
-        error_msg = "✗ Error: frutas-y-verduras.md file not found"
-        print(error_msg)
-        return {'status': 'error', 'error': error_msg}
+        print(f"✓ No pending diff for {category}")
+        return {'status': 'success', 'products_inserted': 0}
     except OperationalError as e:
         error_msg = f"✗ Database error: {e}"
         print(error_msg)
         return {'status': 'error', 'error': error_msg}
     except json.JSONDecodeError as e:
-        error_msg = f"✗ Error parsing LLM response: {e}"
+        error_msg = f"✗ Error parsing JSON: {e}"
         print(error_msg)
         return {'status': 'error', 'error': error_msg}
     except Exception as e:
@@ -429,17 +652,63 @@ def load_products(markdown_file):
         return {'status': 'error', 'error': error_msg}
 
 
-def merge_ingredients():
-    """Merge duplicate ingredient names into their canonical entries."""
-    replacements = {
-        "Egg": "Eggs",
-        "Onion": "Onions",
-        "Oil": "Vegetable Oil",
-        "Plain Flour": "Flour",
-        "White Flour": "Flour",
-        "All purpose flour": "Flour",
-    }
+INGREDIENT_REPLACEMENTS = {
+    "Egg": "Eggs",
+    "Onion": "Onions",
+    "Oil": "Vegetable Oil",
+    "Plain Flour": "Flour",
+    "White Flour": "Flour",
+    "All purpose flour": "Flour",
+}
 
+
+def load_merge_mapping(mapping_file=None, mapping_table=None, cursor=None):
+    """
+    Read a source -> target ingredient name mapping from a JSON object file,
+    a two-column CSV file (source,target) or a two-column table.
+    Defaults to INGREDIENT_REPLACEMENTS.
+    """
+    if mapping_file and mapping_file.endswith('.json'):
+        with open(mapping_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    if mapping_file:
+        with open(mapping_file, 'r', encoding='utf-8', newline='') as f:
+            rows = [row for row in csv.reader(f) if len(row) >= 2]
+        if rows and [cell.strip().lower() for cell in rows[0][:2]] == ['source', 'target']:
+            rows = rows[1:]
+        return {row[0].strip(): row[1].strip() for row in rows}
+
+    if mapping_table:
+        cursor.execute(sql.SQL("SELECT source, target FROM {};").format(sql.Identifier(mapping_table)))
+        return dict(cursor.fetchall())
+
+    return INGREDIENT_REPLACEMENTS
+
+
+def resolve_merge_chains(mapping):
+    """Follow chains (A -> B, B -> C becomes A -> C) and drop self-references and cycles."""
+    lowered = {source.lower(): target for source, target in mapping.items()}
+    resolved = {}
+    for source, target in mapping.items():
+        seen = {source.lower()}
+        while target.lower() in lowered and target.lower() not in seen:
+            seen.add(target.lower())
+            target = lowered[target.lower()]
+        if target.lower() not in seen:
+            resolved[source] = target
+    return resolved
+
+
+def merge_ingredients(mapping_file=None, mapping_table=None, dry_run=False):
+    """
+    Merge duplicate ingredient names into their canonical entries.
+
+    The source -> target mapping (see load_merge_mapping) is loaded into a temp
+    table and every remap runs as one set-based statement per table, in a single
+    transaction: copy recipe and user links, repoint products, delete sources.
+    With dry_run=True the affected row counts are reported and rolled back.
+    """
     try:
         connection = psycopg2.connect(
             host="localhost",
@@ -450,57 +719,110 @@ def merge_ingredients():
 
         cursor = connection.cursor()
 
-        cursor.execute("SELECT id, name FROM ingredient;")
-        ingredients = {name.lower(): id for id, name in cursor.fetchall()}
+        mapping = resolve_merge_chains(load_merge_mapping(mapping_file, mapping_table, cursor))
+
+        cursor.execute(
+            """
+            CREATE TEMP TABLE merge_map (
+                source_name TEXT NOT NULL,
+                target_name TEXT NOT NULL
+            ) ON COMMIT DROP;
+            """
+        )
+        execute_values(
+            cursor,
+            "INSERT INTO merge_map (source_name, target_name) VALUES %s;",
+            list(mapping.items()),
+            page_size=1000,
+        )
 
-        for source, target in replacements.items():
-            source_id = ingredients.get(source.lower())
-            target_id = ingredients.get(target.lower())
+        # Resolve names to ids once; unknown names are reported and skipped
+        cursor.execute(
+            """
+            CREATE TEMP TABLE merge_ids ON COMMIT DROP AS
+            SELECT DISTINCT ON (s.id) s.id AS source_id, t.id AS target_id
+            FROM merge_map m
+            JOIN ingredient s ON lower(s.name) = lower(m.source_name)
+            JOIN ingredient t ON lower(t.name) = lower(m.target_name)
+            WHERE s.id <> t.id
+            ORDER BY s.id, t.id;
+            """
+        )
+        cursor.execute("CREATE INDEX ON merge_ids (source_id);")
+        cursor.execute("ANALYZE merge_ids;")
 
-            if not source_id:
-                print(f"⚠ Skipping '{source}' -> '{target}': source not found")
-                continue
+        cursor.execute(
+            """
+            SELECT m.source_name, m.target_name,
+                   s.id IS NULL AS source_missing, t.id IS NULL AS target_missing
+            FROM merge_map m
+            LEFT JOIN ingredient s ON lower(s.name) = lower(m.source_name)
+            LEFT JOIN ingredient t ON lower(t.name) = lower(m.target_name)
+            WHERE s.id IS NULL OR t.id IS NULL;
+            """
+        )
+        for source, target, source_missing, target_missing in cursor.fetchall():
+            reason = "source not found" if source_missing else "target not found"
+            print(f"⚠ Skipping '{source}' -> '{target}': {reason}")
 
-            if not target_id:
-                print(f"⚠ Skipping '{source}' -> '{target}': target not found")
-                continue
+        counts = {}
 
-            cursor.execute(
-                """
-                INSERT INTO recipe_ingredient (recipe_id, ingredient_id)
-                SELECT recipe_id, %s FROM recipe_ingredient WHERE ingredient_id = %s
-                ON CONFLICT DO NOTHING;
-                """,
-                (target_id, source_id)
-            )
+        cursor.execute(
+            """
+            INSERT INTO recipe_ingredient (recipe_id, ingredient_id)
+            SELECT ri.recipe_id, m.target_id
+            FROM recipe_ingredient ri
+            JOIN merge_ids m ON ri.ingredient_id = m.source_id
+            ON CONFLICT DO NOTHING;
+            """
+        )
+        counts['recipe_links_copied'] = cursor.rowcount
 
-            cursor.execute(
-                """
-                INSERT INTO user_ingredient (user_id, ingredient_id)
-                SELECT user_id, %s FROM user_ingredient WHERE ingredient_id = %s
-                ON CONFLICT DO NOTHING;
-                """,
-                (target_id, source_id)
-            )
+        cursor.execute(
+            """
+            INSERT INTO user_ingredient (user_id, ingredient_id)
+            SELECT ui.user_id, m.target_id
+            FROM user_ingredient ui
+            JOIN merge_ids m ON ui.ingredient_id = m.source_id
+            ON CONFLICT DO NOTHING;
+            """
+        )
+        counts['user_links_copied'] = cursor.rowcount
 
-            cursor.execute(
-                """
-                UPDATE product
-                SET ingredient_id = %s
-                WHERE ingredient_id = %s;
-                """,
-                (target_id, source_id)
-            )
+        cursor.execute(
+            """
+            UPDATE product p
+            SET ingredient_id = m.target_id
+            FROM merge_ids m
+            WHERE p.ingredient_id = m.source_id;
+            """
+        )
+        counts['products_repointed'] = cursor.rowcount
 
-            cursor.execute("DELETE FROM ingredient WHERE id = %s;", (source_id,))
-            print(f"✓ Merged '{source}' into '{target}'")
+        # Source links to recipes and users are removed by ON DELETE CASCADE
+        cursor.execute(
+            """
+            DELETE FROM ingredient i
+            USING merge_ids m
+            WHERE i.id = m.source_id;
+            """
+        )
+        counts['ingredients_deleted'] = cursor.rowcount
 
-        connection.commit()
-        print("✓ Ingredient unification complete!")
+        if dry_run:
+            connection.rollback()
+            print("✓ Dry run, nothing changed:")
+        else:
+            connection.commit()
+            print("✓ Ingredient unification complete!")
+        for key, value in counts.items():
+            print(f"  {key}: {value}")
 
         cursor.close()
         connection.close()
 
+        return counts
+
     except OperationalError as e:
         print(f"✗ Database error: {e}")
     except Exception as e:
@@ -893,8 +1215,11 @@ if __name__ == "__main__":
     # load_ingredients()
     # load_recipes()
     # load_products('data/lacteos-y-quesos.md')
-    # merge_ingredients()
+    # load_product_diff('lacteos-y-quesos')
+    # merge_ingredients(dry_run=True)
+    # merge_ingredients('data/ingredient_merges.csv')
     # translate_recipe_names()
     # translate_ingredient_names()
     # translate_recipe_instructions()
     # load_more_recipes()
+    pass
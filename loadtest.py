@@ -0,0 +1,309 @@
+"""
+Offline load test for the API with a stubbed vision model.
+
+Starts the app under uvicorn in a child process with `api.get_vision_llm`
+replaced by FakeVisionModel, which replays canned JSON answers with a
+configurable latency and failure rate, so /scan-ingredients can be driven
+without calling Gemini. A probe task inside the server measures event-loop
+lag. The parent process sends an open-loop mix of scans, recipe lists,
+pantry edits and product clicks at a target rate (needs httpx) and reports
+per endpoint: throughput, latency percentiles, errors and the loop lag seen
+while those requests were in flight.
+
+Usage:
+    python loadtest.py --rps 50 --duration 30 --llm-latency 3 --llm-failure-rate 0.1
+    python loadtest.py --mix scan=1,recipes=5,pantry=3,click=2 --out loadtest.json
+
+The server uses the same DB_* / DATABASE_URL settings as api.py; pantry
+edits and clicks are written for devices named "load-<n>".
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import multiprocessing
+import os
+import random
+import time
+from types import SimpleNamespace
+
+
+LAG_PROBE_INTERVAL = 0.01
+
+
+class FakeVisionModel:
+    """
+    Drop-in for ChatGoogleGenerativeAI in /scan-ingredients.
+
+    `invoke` blocks for `latency` ± `jitter` seconds like the real client does,
+    raises for a `failure_rate` fraction of calls and otherwise returns one of
+    `responses` (JSON strings) in turn.
+    """
+
+    def __init__(self, responses, latency=1.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.responses = responses
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def _delay(self):
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def _answer(self):
+        self.calls += 1
+        if self.rng.random() < self.failure_rate:
+            raise TimeoutError("Fake vision model failure")
+        content = self.responses[self.calls % len(self.responses)]
+        return SimpleNamespace(
+            content=content,
+            usage_metadata={"input_tokens": 1500, "output_tokens": len(content) // 4},
+        )
+
+    def invoke(self, messages):
+        time.sleep(self._delay())
+        return self._answer()
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self._delay())
+        return self._answer()
+
+
+def default_responses(ingredient_ids, count=20, seed=0):
+    """Canned answers naming a few random catalog ingredients each."""
+    rng = random.Random(seed)
+    responses = []
+    for _ in range(count):
+        picked = rng.sample(ingredient_ids, min(len(ingredient_ids), rng.randint(1, 6)))
+        responses.append(json.dumps([{"id": i, "name": f"ingredient {i}"} for i in picked]))
+    return responses
+
+
+def serve(port, llm_config, ready):
+    """Child process: run the app with the fake model and a loop-lag probe."""
+    import uvicorn
+    import api
+
+    fake = FakeVisionModel(**llm_config)
+    api.get_vision_llm = lambda: fake
+
+    lag_samples = []
+
+    async def probe():
+        while True:
+            expected = time.time() + LAG_PROBE_INTERVAL
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            lag_samples.append((expected, max(0.0, time.time() - expected)))
+
+    async def start_probe():
+        asyncio.get_running_loop().create_task(probe())
+        ready.set()
+
+    api.app.router.on_startup.append(start_probe)
+
+    @api.app.get("/__loadtest/lag", include_in_schema=False)
+    def loop_lag():
+        return {"samples": lag_samples, "llm_calls": fake.calls}
+
+    uvicorn.run(api.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 2)
+
+
+async def drive(base_url, rps, duration, mix, devices, ingredient_ids, product_ids, image, seed):
+    """Send requests at a fixed arrival rate, independent of response times."""
+    import httpx
+
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    records = []
+
+    async def scan(client):
+        # A distinct photo per request, so scans are not answered from the cache
+        files = {"file": ("fridge.jpg", image + rng.randbytes(16), "image/jpeg")}
+        return await client.post("/scan-ingredients", files=files)
+
+    async def recipes(client):
+        return await client.get(f"/recipes/{rng.choice(devices)}")
+
+    async def pantry(client):
+        device = rng.choice(devices)
+        if rng.random() < 0.6:
+            return await client.post(f"/ingredients/{device}", json=rng.sample(ingredient_ids, 3))
+        return await client.get(f"/ingredients/{device}")
+
+    async def click(client):
+        payload = {"device_id": rng.choice(devices), "product_id": rng.choice(product_ids)}
+        return await client.post("/product-clicks", json=payload)
+
+    actions = {"scan": scan, "recipes": recipes, "pantry": pantry, "click": click}
+
+    async def one(client, name):
+        started = time.time()
+        try:
+            response = await actions[name](client)
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        records.append((name, started, time.time(), status))
+
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        tasks = []
+        started = time.perf_counter()
+        sent = 0
+        while time.perf_counter() - started < duration:
+            due = started + sent / rps
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            name = rng.choices(names, weights=weights)[0]
+            tasks.append(asyncio.create_task(one(client, name)))
+            sent += 1
+        await asyncio.gather(*tasks)
+
+        lag = (await client.get("/__loadtest/lag")).json()
+
+    return records, lag
+
+
+def summarize(records, lag_samples, duration):
+    """Per-endpoint throughput, latency and event-loop lag during its requests."""
+    report = {}
+    lag_samples = sorted(lag_samples)
+    lag_times = [t for t, _ in lag_samples]
+
+    for name in sorted({record[0] for record in records}):
+        mine = [record for record in records if record[0] == name]
+        latencies = sorted((end - start) * 1000 for _, start, end, _ in mine)
+        errors = sum(1 for *_, status in mine if not isinstance(status, int) or status >= 500)
+
+        lags = []
+        for _, start, end, _ in mine:
+            lo = bisect.bisect_left(lag_times, start)
+            hi = bisect.bisect_right(lag_times, end)
+            lags.extend(lag for _, lag in lag_samples[lo:hi])
+        lags = sorted(lag * 1000 for lag in lags)
+
+        report[name] = {
+            "requests": len(mine),
+            "errors": errors,
+            "throughput_rps": round(len(mine) / duration, 2),
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": round(latencies[-1], 2) if latencies else None,
+            "loop_lag_p99_ms": percentile(lags, 0.99),
+            "loop_lag_max_ms": round(lags[-1], 2) if lags else None,
+        }
+    return report
+
+
+def catalog_ids():
+    """Ingredient and product ids to build requests from."""
+    import api
+
+    conn = api.get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id FROM ingredient;")
+            ingredient_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT id FROM product;")
+            product_ids = [row[0] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return ingredient_ids, product_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=20)
+    parser.add_argument("--duration", type=float, default=20, help="seconds of traffic")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("scan=1,recipes=4,pantry=3,click=2"))
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="seconds per fake scan")
+    parser.add_argument("--llm-jitter", type=float, default=0.5)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--responses", help="JSON file with a list of canned model answers (strings)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the report as JSON")
+    args = parser.parse_args()
+
+    ingredient_ids, product_ids = catalog_ids()
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            responses = json.load(f)
+    else:
+        responses = default_responses(ingredient_ids, seed=args.seed)
+
+    llm_config = {
+        "responses": responses,
+        "latency": args.llm_latency,
+        "jitter": args.llm_jitter,
+        "failure_rate": args.llm_failure_rate,
+        "seed": args.seed,
+    }
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(args.port, llm_config, ready), daemon=True)
+    server.start()
+    try:
+        if not ready.wait(30):
+            raise RuntimeError("Server did not start")
+        time.sleep(0.5)
+
+        devices = [f"load-{n}" for n in range(args.devices)]
+        image = os.urandom(32 * 1024)
+        records, lag = asyncio.run(drive(
+            f"http://127.0.0.1:{args.port}", args.rps, args.duration, args.mix,
+            devices, ingredient_ids, product_ids, image, args.seed,
+        ))
+    finally:
+        server.terminate()
+        server.join()
+
+    report = {
+        "params": {
+            "rps": args.rps,
+            "duration": args.duration,
+            "mix": args.mix,
+            "llm_latency": args.llm_latency,
+            "llm_jitter": args.llm_jitter,
+            "llm_failure_rate": args.llm_failure_rate,
+        },
+        "llm_calls": lag["llm_calls"],
+        "endpoints": summarize(records, lag["samples"], args.duration),
+    }
+
+    print(f"{'endpoint':<10}{'req':>6}{'err':>5}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'lag p99':>10}{'lag max':>10}")
+    for name, stats in report["endpoints"].items():
+        print(
+            f"{name:<10}{stats['requests']:>6}{stats['errors']:>5}{stats['throughput_rps']:>8}"
+            f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+            f"{str(stats['loop_lag_p99_ms']):>10}{str(stats['loop_lag_max_ms']):>10}"
+        )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
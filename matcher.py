@@ -0,0 +1,276 @@
+"""
+Local matching of scraped product names to ingredients.
+
+Most Jumbo product names contain the Spanish ingredient name verbatim
+("Tomate Larga Vida Granel", "Limón Malla 1 kg"), so they can be resolved
+offline without calling the LLM. Names are normalized (lowercase, accents
+folded, units and filler words dropped) and looked up as token phrases;
+single-word typos and variants fall back to a character trigram index.
+
+Running the module checks the matcher against the product mappings already
+in the database (assigned by the LLM or by hand) and against names known
+to carry a qualifier, and exits non-zero on any disagreement:
+    python matcher.py
+"""
+from collections import defaultdict
+import re
+import sys
+import unicodedata
+
+
+# Words that describe packaging, size or quality rather than the ingredient
+STOPWORDS = {
+    'a', 'al', 'aprox', 'bandeja', 'bolsa', 'caja', 'cc', 'de', 'del', 'el',
+    'en', 'extra', 'frasco', 'g', 'gr', 'granel', 'kg', 'l', 'la', 'las', 'lata',
+    'los', 'lt', 'malla', 'ml', 'pack', 'un', 'unidad', 'unidades', 'x', 'y',
+}
+
+# Chilean names for varieties the catalog names otherwise ("Tomate Cóctel" is
+# "Cherry Tomatoes", "Leche Descremada" is "Skimmed Milk"): never generic
+VARIETY_WORDS = {'coctel', 'descremada', 'semidescremada'}
+
+# Leading letters a leftover word shares with a variant's word to qualify it
+QUALIFIER_STEM = 6
+
+TOKEN_RE = re.compile(r'[a-z]+')
+
+
+def fold_accents(text):
+    """Remove diacritics: 'Limón' -> 'Limon'."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def stem(token):
+    """Very small plural folding that works for both English and Spanish."""
+    # limones -> limon, tomatoes -> tomato; tomates -> tomate falls through to -s
+    if len(token) > 4 and token.endswith('es') and token[-3] in 'lnrdzo':
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def normalize(text):
+    """Lowercase, fold accents and return the list of meaningful stemmed tokens."""
+    text = fold_accents((text or '').lower())
+    return [stem(token) for token in TOKEN_RE.findall(text) if token not in STOPWORDS]
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class IngredientMatcher:
+    """
+    Phrase and trigram index over ingredient `name` and `name_es`.
+
+    `match(product_name)` returns `(ingredient_id, confidence)` or None when
+    the name is ambiguous or unknown and should be left for the LLM.
+    """
+
+    def __init__(self, ingredients, fuzzy_threshold=0.6):
+        """ingredients: iterable of (id, name, name_es) rows."""
+        self.fuzzy_threshold = fuzzy_threshold
+        # first token -> list of (phrase tokens, ingredient_id)
+        self.phrases = defaultdict(list)
+        # any token -> phrases containing it, to spot more specific ingredients
+        self.containing = defaultdict(list)
+        # trigram -> set of single tokens, token -> set of ingredient ids
+        self.trigram_index = defaultdict(set)
+        self.token_ids = defaultdict(set)
+        # Used to break ties between catalog duplicates ("Lemon" vs "Lemons")
+        self.label_length = {}
+        # ingredient_id -> token tuples of its name and name_es
+        self.labels = defaultdict(list)
+
+        for ingredient_id, name, name_es in ingredients:
+            self.label_length[ingredient_id] = len(name or '') + len(name_es or '')
+            for label in (name, name_es):
+                tokens = tuple(normalize(label))
+                if not tokens:
+                    continue
+                self.labels[ingredient_id].append(tokens)
+                entries = self.phrases[tokens[0]]
+                if (tokens, ingredient_id) not in entries:
+                    entries.append((tokens, ingredient_id))
+                    for token in set(tokens):
+                        self.containing[token].append((tokens, ingredient_id))
+                if len(tokens) == 1:
+                    self.token_ids[tokens[0]].add(ingredient_id)
+                    for gram in trigrams(tokens[0]):
+                        self.trigram_index[gram].add(tokens[0])
+
+    def _is_generic(self, phrase, ingredient_id, present):
+        """
+        True when a more specific ingredient extends one of this ingredient's
+        labels and the name has a leftover word qualifying it: "Tomate Beef"
+        matches "tomate" but "beef" is what sets "Beef tomatoes" apart, and
+        "Yogurt Griego" matches "yogurt" but "griego" makes it "yogur griego".
+        """
+        leftover = present - set(phrase)
+        if not leftover:
+            return False
+        for label in self.labels[ingredient_id]:
+            for other, other_id in self.containing[label[0]]:
+                if other_id == ingredient_id or len(other) <= len(label) or not set(label) <= set(other):
+                    continue
+                extra = set(other) - set(label)
+                for token in leftover:
+                    if token in VARIETY_WORDS or token in extra:
+                        return True
+                    # Regional spellings share a stem: "semidescremada" / "semidesnatada"
+                    if len(token) >= QUALIFIER_STEM and any(
+                        word[:QUALIFIER_STEM] == token[:QUALIFIER_STEM] for word in extra
+                    ):
+                        return True
+        return False
+
+    def _phrase_candidates(self, tokens):
+        """Yield (ingredient_id, score, phrase) for every phrase whose tokens all appear in the name."""
+        present = set(tokens)
+        for position, token in enumerate(tokens):
+            for phrase, ingredient_id in self.phrases.get(token, ()):
+                if not present.issuperset(phrase):
+                    continue
+                # Longer phrases are more specific ("pechuga de pollo" over "pollo"),
+                # and Spanish product names lead with the ingredient ("Tomate larga vida").
+                score = 0.75 + 0.05 * min(len(phrase), 4)
+                if tuple(tokens[position:position + len(phrase)]) == phrase:
+                    score += 0.05
+                if position == 0:
+                    score += 0.05
+                if self._is_generic(phrase, ingredient_id, present):
+                    score -= 0.1
+                yield ingredient_id, round(min(score, 1.0), 3), phrase
+
+    def _fuzzy_candidates(self, tokens):
+        """
+        Yield (ingredient_id, score, phrase) for single-word ingredients
+        similar to the leading word. A match at the similarity threshold
+        scores like an exact leading one-word match, so a typo alone does
+        not keep a product from resolving locally.
+        """
+        token = tokens[0]
+        present = set(tokens)
+        grams = trigrams(token)
+        counts = defaultdict(int)
+        for gram in grams:
+            for candidate in self.trigram_index.get(gram, ()):
+                counts[candidate] += 1
+        for candidate, shared in counts.items():
+            similarity = shared / len(grams | trigrams(candidate))
+            if similarity < self.fuzzy_threshold:
+                continue
+            score = 0.9 + 0.1 * (similarity - self.fuzzy_threshold) / (1 - self.fuzzy_threshold)
+            for ingredient_id in self.token_ids[candidate]:
+                if self._is_generic((token,), ingredient_id, present):
+                    yield ingredient_id, round(score - 0.1, 3), (candidate,)
+                else:
+                    yield ingredient_id, round(score, 3), (candidate,)
+
+    def match(self, product_name):
+        tokens = normalize(product_name)
+        if not tokens:
+            return None
+
+        # ingredient_id -> (score, phrase)
+        best = {}
+        candidates = self._phrase_candidates(tokens)
+        for ingredient_id, score, phrase in candidates:
+            if score > best.get(ingredient_id, (0,))[0]:
+                best[ingredient_id] = (score, phrase)
+
+        if not best:
+            # Only the leading word is tried fuzzily; it is where the ingredient is
+            for ingredient_id, score, phrase in self._fuzzy_candidates(tokens):
+                if score > best.get(ingredient_id, (0,))[0]:
+                    best[ingredient_id] = (score, phrase)
+
+        if not best:
+            return None
+
+        top_score = max(score for score, _ in best.values())
+        close = [
+            (ingredient_id, phrase) for ingredient_id, (score, phrase) in best.items()
+            if top_score - score < 0.05
+        ]
+        if len({phrase for _, phrase in close}) > 1:
+            # Different ingredients fit equally well: leave it to the LLM
+            return None
+
+        # Same phrase from several catalog rows: prefer the plainest label
+        ingredient_id = min(close, key=lambda item: (self.label_length[item[0]], item[0]))[0]
+        return ingredient_id, best[ingredient_id][0]
+
+    def match_all(self, products, min_confidence=0.9):
+        """
+        Split products into (matched, leftovers). Matched products get
+        `ingredient_id` and `match_confidence` set; leftovers are untouched.
+        """
+        matched = []
+        leftovers = []
+        for product in products:
+            result = self.match(product['name'])
+            if result and result[1] >= min_confidence:
+                product['ingredient_id'], product['match_confidence'] = result
+                matched.append(product)
+            else:
+                leftovers.append(product)
+        return matched, leftovers
+
+
+# (product name, generic ingredient it must not be matched to locally)
+QUALIFIED_NAMES = [
+    ('Tomate Beef Granel', 'Tomato'),
+    ('Tomate Cóctel Pote 250 g', 'Tomato'),
+    ('Yogurt Griego Danone Oikos Natural Sin Endulzar 150 g', 'Yogurt'),
+    ('Leche Loncoleche Semidescremada Sin Lactosa 1 L', 'Milk'),
+]
+
+
+def check(cursor, min_confidence=0.9):
+    """
+    Compare local matches with the mapped products in the database.
+    Returns (products matched locally, list of disagreement messages).
+    """
+    cursor.execute("SELECT id, name, name_es FROM ingredient;")
+    rows = cursor.fetchall()
+    names = {ingredient_id: name for ingredient_id, name, _ in rows}
+    matcher = IngredientMatcher(rows)
+
+    cursor.execute("SELECT DISTINCT name, ingredient_id FROM product WHERE ingredient_id IS NOT NULL;")
+    expected = dict(cursor.fetchall())
+    generic = dict(QUALIFIED_NAMES)
+    for product_name in generic:
+        expected.setdefault(product_name, None)
+
+    matched = 0
+    problems = []
+    for product_name, ingredient_id in expected.items():
+        result = matcher.match(product_name)
+        if not result or result[1] < min_confidence:
+            continue
+        matched += 1
+        if names[result[0]] == generic.get(product_name):
+            problems.append(f"{product_name!r}: generic {names[result[0]]!r} despite its qualifier")
+        elif ingredient_id is not None and result[0] != ingredient_id:
+            problems.append(f"{product_name!r}: {names[result[0]]!r}, mapped to {names.get(ingredient_id)!r}")
+    return matched, problems
+
+
+if __name__ == "__main__":
+    from migrations import get_connection
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            matched, problems = check(cur)
+        for problem in problems:
+            print(f"✗ {problem}")
+        if problems:
+            sys.exit(1)
+        print(f"✓ {matched} local matches agree with the database")
+    finally:
+        conn.close()
@@ -0,0 +1,249 @@
+"""
+Minimal Prometheus instrumentation for the API.
+
+Counters, gauges and histograms are kept in plain dicts keyed by label
+values and rendered in the Prometheus text format by `render()`. Recording
+a value is a dict lookup, a bisect and an addition under a lock, a few
+microseconds at most, so no client library is needed.
+
+Requests are timed by MetricsMiddleware (a plain ASGI middleware, cheaper
+than @app.middleware). It keeps the ASGI scope in a context variable so
+database statements issued while serving a request are labelled with the
+route that was matched for it; see InstrumentedConnection.
+"""
+from bisect import bisect_left
+from contextvars import ContextVar
+import os
+import resource
+import sys
+import threading
+import time
+import psycopg2.extensions
+
+
+# Seconds; covers cache hits through slow LLM scans
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+# ASGI scope of the request being served, if any
+current_scope = ContextVar("current_scope", default=None)
+
+REGISTRY = []
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for label_values, value in items:
+            yield self.name, format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value):
+        with self.lock:
+            self.values[label_values] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (+Inf last), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self.lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self.values.items()]
+        for label_values, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket",
+                    format_labels(self.labels + ("le",), label_values + (bound,)),
+                    cumulative,
+                )
+            yield f"{self.name}_sum", format_labels(self.labels, label_values), total
+            yield f"{self.name}_count", format_labels(self.labels, label_values), cumulative
+
+
+def resident_memory():
+    """Resident set size of this process in bytes (peak size where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request latency by route and status",
+    labels=("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served", labels=("method",),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Statement execution time by handler route",
+    labels=("route",), buckets=DB_BUCKETS,
+)
+DB_CONNECT_DURATION = Histogram(
+    "db_connection_acquire_seconds", "Time to obtain a database connection",
+    buckets=DB_BUCKETS,
+)
+LLM_CALL_DURATION = Histogram(
+    "llm_call_duration_seconds", "LLM call latency", labels=("operation", "outcome"),
+)
+LLM_TOKENS = Histogram(
+    "llm_tokens", "Tokens per LLM call", labels=("operation", "direction"), buckets=TOKEN_BUCKETS,
+)
+
+
+def route_of(scope):
+    """Route template of a request ("/recipes/{device_id}"), or "unmatched"."""
+    if scope is None:
+        return "none"
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and tracks requests in flight."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        token = current_scope.set(scope)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method, route_of(scope), status)
+            HTTP_IN_FLIGHT.dec(method)
+            current_scope.reset(token)
+
+
+# Called as hook(cursor, query, vars, seconds, route) after each successful
+# statement; see profiling.py
+statement_hooks = []
+
+_cursor_classes = {}
+
+
+def record_statement(cursor, query, vars, started, succeeded):
+    elapsed = time.perf_counter() - started
+    route = route_of(current_scope.get())
+    DB_QUERY_DURATION.observe(elapsed, route)
+    if succeeded:
+        for hook in statement_hooks:
+            hook(cursor, query, vars, elapsed, route)
+
+
+def instrumented_cursor(base):
+    """Subclass of cursor class `base` that times every statement."""
+    cls = _cursor_classes.get(base)
+    if cls is None:
+        class InstrumentedCursor(base):
+            def execute(self, query, vars=None):
+                started = time.perf_counter()
+                succeeded = False
+                try:
+                    result = super().execute(query, vars)
+                    succeeded = True
+                    return result
+                finally:
+                    record_statement(self, query, vars, started, succeeded)
+
+            def executemany(self, query, vars_list):
+                started = time.perf_counter()
+                succeeded = False
+                try:
+                    result = super().executemany(query, vars_list)
+                    succeeded = True
+                    return result
+                finally:
+                    record_statement(self, query, None, started, succeeded)
+
+        cls = _cursor_classes[base] = InstrumentedCursor
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors, whatever their cursor_factory, are timed."""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.pop("cursor_factory", None) or self.cursor_factory or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=instrumented_cursor(base), **kwargs)
@@ -0,0 +1,802 @@
+"""
+Versioned schema migrations.
+
+Each migration runs once and is recorded in `schema_migration`. Steps are
+SQL strings or callables taking a cursor, written to be idempotent (IF NOT
+EXISTS, invalid leftovers dropped first), so re-running after a failure
+picks up where it stopped. Index builds use
+CREATE INDEX CONCURRENTLY, which cannot run inside a transaction; those
+migrations set "transactional": False and run in autocommit mode.
+
+Migrations may list "explain" queries: their plans are printed before and
+after the migration and stored with the version row as evidence.
+
+Usage:
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied and pending versions
+"""
+from dotenv import load_dotenv
+import os
+import sys
+import time
+import psycopg2
+import partitions
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "database": os.getenv("DB_NAME", "cocina"),
+    "user": os.getenv("DB_USER", "s7"),
+    "password": os.getenv("DB_PASSWORD", "123456"),
+}
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Serializes concurrent runners (e.g. several instances starting at once)
+MIGRATION_LOCK_ID = 4_310_001
+
+# Pantry versions per user whose changes are kept for delta sync
+PANTRY_HISTORY_VERSIONS = 100
+
+# Sample ids used only to produce representative EXPLAIN plans
+SAMPLE_PANTRY = [30, 260, 309, 282, 249, 276, 187, 183]
+
+
+def drop_invalid_index(name):
+    """Step that drops an INVALID index left behind by a failed concurrent build."""
+    def step(cursor):
+        cursor.execute(
+            """
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = %s AND NOT i.indisvalid;
+            """,
+            (name,),
+        )
+        if cursor.fetchone():
+            cursor.execute(f"DROP INDEX CONCURRENTLY {name};")
+    return step
+
+
+def create_index_concurrently(name, table, columns, method="btree"):
+    """Steps that build an index without blocking writes to the table."""
+    return [
+        # IF NOT EXISTS alone would keep a broken index from an earlier attempt
+        drop_invalid_index(name),
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {method} ({columns});",
+        f"ANALYZE {table};",
+    ]
+
+
+def partition_product_click(cursor):
+    """
+    Rebuild product_click as a table range partitioned by month on created_at.
+    Ids, the id sequence, foreign keys and the (user_id, created_at) index
+    are kept, so inserts from /product-clicks work unchanged.
+    """
+    if partitions.is_partitioned(cursor):
+        return
+
+    cursor.execute("LOCK TABLE product_click IN ACCESS EXCLUSIVE MODE;")
+    cursor.execute("ALTER TABLE product_click RENAME TO product_click_unpartitioned;")
+    # Index names are schema-wide; free them for the new table
+    cursor.execute("ALTER TABLE product_click_unpartitioned RENAME CONSTRAINT product_click_pkey TO product_click_unpartitioned_pkey;")
+    cursor.execute("DROP INDEX IF EXISTS product_click_user_id_created_at_idx;")
+    # Otherwise dropping the old table drops the sequence with it
+    cursor.execute("ALTER SEQUENCE product_click_id_seq OWNED BY NONE;")
+
+    # The partition key must be part of the primary key
+    cursor.execute(
+        """
+        CREATE TABLE product_click (
+            id INTEGER NOT NULL DEFAULT nextval('product_click_id_seq'),
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, created_at),
+            FOREIGN KEY (user_id) REFERENCES "user"(id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES product(id) ON DELETE CASCADE
+        ) PARTITION BY RANGE (created_at);
+        """
+    )
+    cursor.execute("ALTER SEQUENCE product_click_id_seq OWNED BY product_click.id;")
+    cursor.execute("CREATE INDEX product_click_user_id_created_at_idx ON product_click (user_id, created_at);")
+    cursor.execute(f"CREATE TABLE {partitions.DEFAULT_PARTITION} PARTITION OF product_click DEFAULT;")
+
+    cursor.execute("SELECT MIN(created_at) FROM product_click_unpartitioned;")
+    oldest = cursor.fetchone()[0]
+    partitions.ensure_partitions(cursor, first_month=oldest.date() if oldest else None)
+
+    cursor.execute(
+        """
+        INSERT INTO product_click (id, user_id, product_id, created_at)
+        SELECT id, user_id, product_id, COALESCE(created_at, CURRENT_TIMESTAMP)
+        FROM product_click_unpartitioned;
+        """
+    )
+    cursor.execute("DROP TABLE product_click_unpartitioned;")
+    cursor.execute("ANALYZE product_click;")
+
+
+MIGRATIONS = [
+    {
+        "version": 1,
+        "name": "recipe_ingredient reverse lookup by ingredient",
+        "transactional": False,
+        "statements": create_index_concurrently(
+            "recipe_ingredient_ingredient_id_idx", "recipe_ingredient", "ingredient_id, recipe_id"
+        ),
+        "explain": [
+            (
+                "SELECT recipe_id FROM recipe_ingredient WHERE ingredient_id = ANY(%s);",
+                (SAMPLE_PANTRY,),
+            ),
+        ],
+    },
+    {
+        "version": 2,
+        "name": "product lookup by ingredient",
+        "transactional": False,
+        "statements": create_index_concurrently(
+            "product_ingredient_id_idx", "product", "ingredient_id"
+        ),
+        "explain": [
+            (
+                "SELECT id, name, price, url FROM product WHERE ingredient_id = ANY(%s);",
+                (SAMPLE_PANTRY,),
+            ),
+        ],
+    },
+    {
+        "version": 3,
+        "name": "product_click history by user",
+        "transactional": False,
+        "statements": create_index_concurrently(
+            "product_click_user_id_created_at_idx", "product_click", "user_id, created_at"
+        ),
+        "explain": [
+            (
+                "SELECT product_id, created_at FROM product_click WHERE user_id = %s ORDER BY created_at DESC LIMIT 20;",
+                (1,),
+            ),
+        ],
+    },
+    {
+        "version": 4,
+        "name": "recipe.ingredient_ids kept in sync with recipe_ingredient",
+        "statements": [
+            """
+            ALTER TABLE recipe
+            ADD COLUMN IF NOT EXISTS ingredient_ids INTEGER[] NOT NULL DEFAULT '{}';
+            """,
+            # Statement-level triggers with transition tables: a bulk load of
+            # recipe_ingredient rewrites each touched recipe once, not once per row.
+            # Readers keep seeing the previous row version until commit (MVCC).
+            """
+            CREATE OR REPLACE FUNCTION recipe_ingredient_array(rid INTEGER) RETURNS INTEGER[] AS $$
+                SELECT COALESCE(array_agg(ingredient_id ORDER BY ingredient_id), '{}')
+                FROM recipe_ingredient
+                WHERE recipe_id = rid;
+            $$ LANGUAGE sql STABLE;
+            """,
+            """
+            CREATE OR REPLACE FUNCTION refresh_recipe_ingredient_ids() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    UPDATE recipe SET ingredient_ids = recipe_ingredient_array(id)
+                    WHERE id IN (SELECT recipe_id FROM new_rows);
+                ELSIF TG_OP = 'DELETE' THEN
+                    UPDATE recipe SET ingredient_ids = recipe_ingredient_array(id)
+                    WHERE id IN (SELECT recipe_id FROM old_rows);
+                ELSE
+                    UPDATE recipe SET ingredient_ids = recipe_ingredient_array(id)
+                    WHERE id IN (SELECT recipe_id FROM new_rows UNION SELECT recipe_id FROM old_rows);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """,
+            "DROP TRIGGER IF EXISTS recipe_ingredient_ids_insert ON recipe_ingredient;",
+            """
+            CREATE TRIGGER recipe_ingredient_ids_insert
+            AFTER INSERT ON recipe_ingredient
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION refresh_recipe_ingredient_ids();
+            """,
+            "DROP TRIGGER IF EXISTS recipe_ingredient_ids_delete ON recipe_ingredient;",
+            """
+            CREATE TRIGGER recipe_ingredient_ids_delete
+            AFTER DELETE ON recipe_ingredient
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION refresh_recipe_ingredient_ids();
+            """,
+            "DROP TRIGGER IF EXISTS recipe_ingredient_ids_update ON recipe_ingredient;",
+            """
+            CREATE TRIGGER recipe_ingredient_ids_update
+            AFTER UPDATE ON recipe_ingredient
+            REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION refresh_recipe_ingredient_ids();
+            """,
+            # Backfill; only rows that differ are rewritten
+            """
+            UPDATE recipe r
+            SET ingredient_ids = agg.ids
+            FROM (
+                SELECT recipe_id, array_agg(ingredient_id ORDER BY ingredient_id) AS ids
+                FROM recipe_ingredient
+                GROUP BY recipe_id
+            ) agg
+            WHERE r.id = agg.recipe_id AND r.ingredient_ids IS DISTINCT FROM agg.ids;
+            """,
+        ],
+    },
+    {
+        "version": 5,
+        "name": "GIN index on recipe.ingredient_ids",
+        "transactional": False,
+        "statements": create_index_concurrently(
+            "recipe_ingredient_ids_gin_idx", "recipe", "ingredient_ids", method="gin"
+        ),
+        "explain": [
+            (
+                "SELECT id FROM recipe WHERE ingredient_ids && %s::int[];",
+                (SAMPLE_PANTRY,),
+            ),
+        ],
+    },
+    {
+        "version": 6,
+        "name": "hourly and daily product_click rollups",
+        # Filled by rollups.py; no foreign keys so catalog reloads don't cascade into history
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS rollup_watermark (
+                name TEXT PRIMARY KEY,
+                last_id BIGINT NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS product_click_hour (
+                bucket TIMESTAMP NOT NULL,
+                product_id INTEGER NOT NULL,
+                clicks INTEGER NOT NULL,
+                PRIMARY KEY (bucket, product_id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS product_click_day (
+                bucket DATE NOT NULL,
+                product_id INTEGER NOT NULL,
+                clicks INTEGER NOT NULL,
+                PRIMARY KEY (bucket, product_id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS ingredient_click_hour (
+                bucket TIMESTAMP NOT NULL,
+                ingredient_id INTEGER NOT NULL,
+                clicks INTEGER NOT NULL,
+                PRIMARY KEY (bucket, ingredient_id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS ingredient_click_day (
+                bucket DATE NOT NULL,
+                ingredient_id INTEGER NOT NULL,
+                clicks INTEGER NOT NULL,
+                PRIMARY KEY (bucket, ingredient_id)
+            );
+            """,
+            # Time series of one product / ingredient
+            "CREATE INDEX IF NOT EXISTS product_click_hour_product_id_idx ON product_click_hour (product_id, bucket);",
+            "CREATE INDEX IF NOT EXISTS product_click_day_product_id_idx ON product_click_day (product_id, bucket);",
+            "CREATE INDEX IF NOT EXISTS ingredient_click_hour_ingredient_id_idx ON ingredient_click_hour (ingredient_id, bucket);",
+            "CREATE INDEX IF NOT EXISTS ingredient_click_day_ingredient_id_idx ON ingredient_click_day (ingredient_id, bucket);",
+        ],
+    },
+    {
+        "version": 7,
+        "name": "product_click partitioned by month",
+        # Copies the table under an exclusive lock; clicks wait for the copy
+        "statements": [partition_product_click],
+        "explain": [
+            (
+                "SELECT product_id, created_at FROM product_click WHERE user_id = %s ORDER BY created_at DESC LIMIT 20;",
+                (1,),
+            ),
+        ],
+    },
+    {
+        "version": 8,
+        "name": "pantry versions and change log",
+        "statements": [
+            'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS pantry_version INTEGER NOT NULL DEFAULT 0;',
+            """
+            CREATE TABLE IF NOT EXISTS pantry_change (
+                user_id INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                ingredient_id INTEGER NOT NULL,
+                added BOOLEAN NOT NULL,
+                PRIMARY KEY (user_id, version, ingredient_id),
+                FOREIGN KEY (user_id) REFERENCES "user"(id) ON DELETE CASCADE
+            );
+            """,
+            # Each statement changing pantries bumps every touched user's version
+            # once and logs the net added/removed ids under the new version
+            f"""
+            CREATE OR REPLACE FUNCTION record_pantry_changes() RETURNS trigger AS $$
+            DECLARE
+                changes JSONB;
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    SELECT jsonb_agg(jsonb_build_object('user_id', user_id, 'ingredient_id', ingredient_id, 'added', TRUE))
+                    INTO changes FROM new_rows;
+                ELSIF TG_OP = 'DELETE' THEN
+                    SELECT jsonb_agg(jsonb_build_object('user_id', user_id, 'ingredient_id', ingredient_id, 'added', FALSE))
+                    INTO changes FROM old_rows;
+                ELSE
+                    SELECT jsonb_agg(jsonb_build_object('user_id', user_id, 'ingredient_id', ingredient_id, 'added', added))
+                    INTO changes FROM (
+                        (SELECT user_id, ingredient_id, TRUE AS added FROM new_rows
+                         EXCEPT SELECT user_id, ingredient_id, TRUE FROM old_rows)
+                        UNION ALL
+                        (SELECT user_id, ingredient_id, FALSE FROM old_rows
+                         EXCEPT SELECT user_id, ingredient_id, FALSE FROM new_rows)
+                    ) moved;
+                END IF;
+
+                IF changes IS NULL THEN
+                    RETURN NULL;
+                END IF;
+
+                WITH delta AS (
+                    SELECT * FROM jsonb_to_recordset(changes) AS d(user_id INTEGER, ingredient_id INTEGER, added BOOLEAN)
+                ),
+                bumped AS (
+                    UPDATE "user" u SET pantry_version = u.pantry_version + 1
+                    WHERE u.id IN (SELECT user_id FROM delta)
+                    RETURNING u.id, u.pantry_version
+                )
+                INSERT INTO pantry_change (user_id, version, ingredient_id, added)
+                SELECT b.id, b.pantry_version, d.ingredient_id, d.added
+                FROM bumped b JOIN delta d ON d.user_id = b.id;
+
+                DELETE FROM pantry_change c
+                USING "user" u
+                WHERE c.user_id = u.id
+                  AND u.id IN (SELECT (change->>'user_id')::int FROM jsonb_array_elements(changes) change)
+                  AND c.version <= u.pantry_version - {PANTRY_HISTORY_VERSIONS};
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """,
+            "DROP TRIGGER IF EXISTS user_ingredient_changes_insert ON user_ingredient;",
+            """
+            CREATE TRIGGER user_ingredient_changes_insert
+            AFTER INSERT ON user_ingredient
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION record_pantry_changes();
+            """,
+            "DROP TRIGGER IF EXISTS user_ingredient_changes_delete ON user_ingredient;",
+            """
+            CREATE TRIGGER user_ingredient_changes_delete
+            AFTER DELETE ON user_ingredient
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION record_pantry_changes();
+            """,
+            "DROP TRIGGER IF EXISTS user_ingredient_changes_update ON user_ingredient;",
+            """
+            CREATE TRIGGER user_ingredient_changes_update
+            AFTER UPDATE ON user_ingredient
+            REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION record_pantry_changes();
+            """,
+        ],
+    },
+    {
+        "version": 9,
+        "name": "recipe search columns",
+        # Adding stored generated columns rewrites recipe under an exclusive lock
+        "statements": [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+            "CREATE EXTENSION IF NOT EXISTS unaccent;",
+            # unaccent() is only STABLE (its dictionary could change), which index
+            # expressions and generated columns do not accept
+            """
+            CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text AS $$
+                SELECT public.unaccent('public.unaccent', $1);
+            $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+            """,
+            # Both names, lowercased and without accents, for trigram matching
+            """
+            ALTER TABLE recipe ADD COLUMN IF NOT EXISTS search_name TEXT
+            GENERATED ALWAYS AS (f_unaccent(lower(name || ' ' || COALESCE(name_es, '')))) STORED;
+            """,
+            # Each language with its own stemmer. Instructions get their own vector:
+            # ranking reads the whole vector, and name vectors stay a few words long
+            """
+            ALTER TABLE recipe ADD COLUMN IF NOT EXISTS name_vector TSVECTOR
+            GENERATED ALWAYS AS (
+                to_tsvector('english', f_unaccent(name)) ||
+                to_tsvector('spanish', f_unaccent(COALESCE(name_es, '')))
+            ) STORED;
+            """,
+            """
+            ALTER TABLE recipe ADD COLUMN IF NOT EXISTS instructions_vector TSVECTOR
+            GENERATED ALWAYS AS (
+                to_tsvector('english', f_unaccent(COALESCE(instructions, ''))) ||
+                to_tsvector('spanish', f_unaccent(COALESCE(instructions_es, '')))
+            ) STORED;
+            """,
+        ],
+    },
+    {
+        "version": 10,
+        "name": "recipe search indexes",
+        "transactional": False,
+        "statements": (
+            create_index_concurrently(
+                "recipe_search_name_trgm_idx", "recipe", "search_name gin_trgm_ops", method="gin"
+            )
+            + create_index_concurrently(
+                "recipe_name_vector_idx", "recipe", "name_vector", method="gin"
+            )
+            + create_index_concurrently(
+                "recipe_instructions_vector_idx", "recipe", "instructions_vector", method="gin"
+            )
+        ),
+        "explain": [
+            (
+                """
+                SELECT id FROM recipe
+                WHERE name_vector @@ (websearch_to_tsquery('english', f_unaccent(%s)) || websearch_to_tsquery('spanish', f_unaccent(%s)))
+                   OR f_unaccent(lower(%s)) <%% search_name;
+                """,
+                ("pollo", "pollo", "pollo"),
+            ),
+        ],
+    },
+    {
+        "version": 11,
+        "name": "user_ingredient reverse lookup by ingredient",
+        "transactional": False,
+        "statements": create_index_concurrently(
+            "user_ingredient_ingredient_id_idx", "user_ingredient", "ingredient_id, user_id"
+        ),
+    },
+    {
+        "version": 12,
+        "name": "per-user recipe match counts",
+        # One row per (user, recipe sharing at least one pantry ingredient).
+        # Pantry edits adjust the counts of the recipes using the changed
+        # ingredients (recipe_ingredient_ingredient_id_idx); catalog edits
+        # recount the touched recipes for the users holding their ingredients.
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS user_recipe_match (
+                user_id INTEGER NOT NULL,
+                recipe_id INTEGER NOT NULL,
+                match_count INTEGER NOT NULL,
+                missing_count INTEGER NOT NULL,
+                PRIMARY KEY (user_id, recipe_id),
+                FOREIGN KEY (user_id) REFERENCES "user"(id) ON DELETE CASCADE,
+                FOREIGN KEY (recipe_id) REFERENCES recipe(id) ON DELETE CASCADE
+            );
+            """,
+            # "Cookable now" and "missing at most N" for a user
+            "CREATE INDEX IF NOT EXISTS user_recipe_match_missing_idx ON user_recipe_match (user_id, missing_count, recipe_id);",
+            """
+            CREATE OR REPLACE FUNCTION update_user_recipe_matches() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                    WITH lost AS (
+                        SELECT o.user_id, ri.recipe_id, COUNT(*) AS n
+                        FROM old_rows o
+                        JOIN recipe_ingredient ri ON ri.ingredient_id = o.ingredient_id
+                        GROUP BY o.user_id, ri.recipe_id
+                    )
+                    UPDATE user_recipe_match m
+                    SET match_count = m.match_count - lost.n, missing_count = m.missing_count + lost.n
+                    FROM lost
+                    WHERE m.user_id = lost.user_id AND m.recipe_id = lost.recipe_id;
+
+                    DELETE FROM user_recipe_match
+                    WHERE user_id IN (SELECT user_id FROM old_rows) AND match_count <= 0;
+                END IF;
+
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO user_recipe_match (user_id, recipe_id, match_count, missing_count)
+                    SELECT n.user_id, r.id, COUNT(*), cardinality(r.ingredient_ids) - COUNT(*)
+                    FROM new_rows n
+                    JOIN recipe_ingredient ri ON ri.ingredient_id = n.ingredient_id
+                    JOIN recipe r ON r.id = ri.recipe_id
+                    GROUP BY n.user_id, r.id
+                    ON CONFLICT (user_id, recipe_id) DO UPDATE
+                    SET match_count = user_recipe_match.match_count + EXCLUDED.match_count,
+                        missing_count = user_recipe_match.missing_count - EXCLUDED.match_count;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """,
+            """
+            CREATE OR REPLACE FUNCTION recount_recipe_matches(recipe_ids INTEGER[]) RETURNS void AS $$
+                DELETE FROM user_recipe_match WHERE recipe_id = ANY(recipe_ids);
+
+                INSERT INTO user_recipe_match (user_id, recipe_id, match_count, missing_count)
+                SELECT ui.user_id, ri.recipe_id, COUNT(*), total.n - COUNT(*)
+                FROM recipe_ingredient ri
+                JOIN user_ingredient ui ON ui.ingredient_id = ri.ingredient_id
+                JOIN (
+                    SELECT recipe_id, COUNT(*) AS n
+                    FROM recipe_ingredient
+                    WHERE recipe_id = ANY(recipe_ids)
+                    GROUP BY recipe_id
+                ) total ON total.recipe_id = ri.recipe_id
+                GROUP BY ui.user_id, ri.recipe_id, total.n;
+            $$ LANGUAGE sql;
+            """,
+            """
+            CREATE OR REPLACE FUNCTION recount_changed_recipe_matches() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    PERFORM recount_recipe_matches(ARRAY(SELECT DISTINCT recipe_id FROM new_rows));
+                ELSIF TG_OP = 'DELETE' THEN
+                    PERFORM recount_recipe_matches(ARRAY(SELECT DISTINCT recipe_id FROM old_rows));
+                ELSE
+                    PERFORM recount_recipe_matches(ARRAY(
+                        SELECT recipe_id FROM new_rows UNION SELECT recipe_id FROM old_rows
+                    ));
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """,
+        ]
+        + [
+            statement
+            for table, function in (
+                ("user_ingredient", "update_user_recipe_matches"),
+                ("recipe_ingredient", "recount_changed_recipe_matches"),
+            )
+            for statement in (
+                f"DROP TRIGGER IF EXISTS {table}_recipe_match_insert ON {table};",
+                f"""
+                CREATE TRIGGER {table}_recipe_match_insert
+                AFTER INSERT ON {table}
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+                """,
+                f"DROP TRIGGER IF EXISTS {table}_recipe_match_delete ON {table};",
+                f"""
+                CREATE TRIGGER {table}_recipe_match_delete
+                AFTER DELETE ON {table}
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+                """,
+                f"DROP TRIGGER IF EXISTS {table}_recipe_match_update ON {table};",
+                f"""
+                CREATE TRIGGER {table}_recipe_match_update
+                AFTER UPDATE ON {table}
+                REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION {function}();
+                """,
+            )
+        ]
+        + [
+            # Backfill
+            "SELECT recount_recipe_matches(ARRAY(SELECT id FROM recipe));",
+            "ANALYZE user_recipe_match;",
+        ],
+    },
+    {
+        "version": 13,
+        "name": "co-occurrence recommendation tables",
+        # Filled by recommend.py, read by primary key in the API
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS user_product_click (
+                user_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                clicks INTEGER NOT NULL,
+                PRIMARY KEY (user_id, product_id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS item_neighbor (
+                kind TEXT NOT NULL CHECK (kind IN ('ingredient', 'product')),
+                item_id INTEGER NOT NULL,
+                neighbor_ids INTEGER[] NOT NULL,
+                scores REAL[] NOT NULL,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (kind, item_id)
+            );
+            """,
+        ],
+    },
+    {
+        "version": 14,
+        "name": "catalog version",
+        # Bumped by every statement changing the catalog; catalog.py keys
+        # its shared snapshots on it
+        "statements": [
+            """
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                version BIGINT NOT NULL DEFAULT 1,
+                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+            """,
+            "INSERT INTO catalog_version DEFAULT VALUES ON CONFLICT (id) DO NOTHING;",
+            """
+            CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+            BEGIN
+                UPDATE catalog_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+            """,
+        ]
+        + [
+            statement
+            for table in ("ingredient", "recipe", "recipe_ingredient", "product")
+            for statement in (
+                f"DROP TRIGGER IF EXISTS {table}_catalog_version ON {table};",
+                f"""
+                CREATE TRIGGER {table}_catalog_version
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+                """,
+            )
+        ],
+    },
+    {
+        "version": 15,
+        "name": "soft-deleted products",
+        # Products gone from the store keep their row, so their clicks stay in
+        # product_click and its rollups; the catalog leaves them out
+        "statements": [
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS removed_at TIMESTAMP;",
+        ],
+    },
+    {
+        "version": 16,
+        "name": "product match confidence",
+        # Set by db.py when a product is matched to an ingredient, locally or by the LLM
+        "statements": [
+            "ALTER TABLE product ADD COLUMN IF NOT EXISTS match_confidence REAL;",
+        ],
+    },
+]
+
+
+def get_connection():
+    if DATABASE_URL:
+        return psycopg2.connect(DATABASE_URL, sslmode="require")
+    return psycopg2.connect(**DB_CONFIG)
+
+
+def ensure_version_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migration (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                duration_ms REAL,
+                evidence TEXT
+            );
+            """
+        )
+    connection.commit()
+
+
+def applied_versions(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT version FROM schema_migration;")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def explain(cursor, queries):
+    """Return the EXPLAIN (ANALYZE, BUFFERS) plans of queries as one text block."""
+    plans = []
+    for query, params in queries:
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        plans.append(f"{query}\n{plan}")
+    return "\n\n".join(plans)
+
+
+def apply_migration(connection, migration):
+    queries = migration.get("explain", [])
+    transactional = migration.get("transactional", True)
+
+    with connection.cursor() as cursor:
+        before = explain(cursor, queries) if queries else ""
+    connection.commit()
+
+    started = time.perf_counter()
+    connection.autocommit = not transactional
+    try:
+        with connection.cursor() as cursor:
+            for statement in migration["statements"]:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+        if transactional:
+            connection.commit()
+    except psycopg2.Error:
+        if transactional:
+            connection.rollback()
+        raise
+    finally:
+        connection.autocommit = False
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    with connection.cursor() as cursor:
+        after = explain(cursor, queries) if queries else ""
+        evidence = f"-- before\n{before}\n\n-- after\n{after}" if queries else None
+        cursor.execute(
+            """
+            INSERT INTO schema_migration (version, name, duration_ms, evidence)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (version) DO NOTHING;
+            """,
+            (migration["version"], migration["name"], duration_ms, evidence),
+        )
+    connection.commit()
+
+    print(f"✓ Applied migration {migration['version']}: {migration['name']} ({duration_ms:.0f}ms)")
+    if evidence:
+        print(evidence)
+
+
+def migrate(connection=None):
+    """Apply every pending migration in version order."""
+    own_connection = connection is None
+    connection = connection or get_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+        connection.commit()
+
+        ensure_version_table(connection)
+        done = applied_versions(connection)
+        pending = [m for m in sorted(MIGRATIONS, key=lambda m: m["version"]) if m["version"] not in done]
+
+        if not pending:
+            print("✓ Schema is up to date")
+        for migration in pending:
+            apply_migration(connection, migration)
+    finally:
+        if not connection.closed:
+            connection.rollback()
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+            connection.commit()
+        if own_connection:
+            connection.close()
+
+
+def status(connection=None):
+    own_connection = connection is None
+    connection = connection or get_connection()
+    try:
+        ensure_version_table(connection)
+        done = applied_versions(connection)
+        for migration in sorted(MIGRATIONS, key=lambda m: m["version"]):
+            mark = "✓" if migration["version"] in done else "·"
+            print(f"{mark} {migration['version']:>3} {migration['name']}")
+    finally:
+        if own_connection:
+            connection.close()
+
+
+if __name__ == "__main__":
+    if "--status" in sys.argv:
+        status()
+    else:
+        migrate()
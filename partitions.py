@@ -0,0 +1,245 @@
+"""
+Monthly partitions of product_click.
+
+product_click is range partitioned on created_at (migration 7), one
+partition per month named product_click_yYYYYmMM, plus a default partition
+that only catches rows no monthly partition covers. Maintenance:
+
+- creates the partitions for the current month and PARTITION_MONTHS_AHEAD
+  months after it, so inserts never land in the default partition;
+- applies retention: partitions older than PRODUCT_CLICK_RETENTION_MONTHS
+  are detached (kept as plain tables) or, with PRODUCT_CLICK_RETENTION_DROP=1,
+  dropped. Both are catalog operations, no DELETE and no vacuum debt.
+  A partition still holding clicks the rollups have not seen is kept.
+
+The API runs `start_background_maintenance()` at startup.
+
+Usage:
+    python partitions.py            # create future partitions, apply retention
+    python partitions.py --list
+"""
+from datetime import date
+import os
+import sys
+import threading
+import time
+import psycopg2
+from psycopg2 import sql
+import rollups
+
+PARTITION_MONTHS_AHEAD = 3
+PRODUCT_CLICK_RETENTION_MONTHS = int(os.getenv("PRODUCT_CLICK_RETENTION_MONTHS", "13"))
+PRODUCT_CLICK_RETENTION_DROP = os.getenv("PRODUCT_CLICK_RETENTION_DROP") == "1"
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600"))
+
+PARTITION_LOCK_ID = 4_310_004
+
+PARENT = "product_click"
+DEFAULT_PARTITION = "product_click_default"
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{PARENT}_y{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (PARENT,))
+    row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def list_partitions(cursor):
+    """[(name, lower bound, upper bound)] of the monthly partitions, oldest first."""
+    cursor.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass AND c.relname <> %s
+        ORDER BY c.relname;
+        """,
+        (PARENT, DEFAULT_PARTITION),
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        # FOR VALUES FROM ('2026-01-01 00:00:00') TO ('2026-02-01 00:00:00')
+        lower, upper = (part.split("'")[1][:10] for part in bound.split(" TO "))
+        partitions.append((name, date.fromisoformat(lower), date.fromisoformat(upper)))
+    return partitions
+
+
+def create_month_partition(cursor, month):
+    """
+    Create the partition for `month` if missing. Rows for that month already
+    in the default partition are moved into it before it is attached.
+    """
+    name = partition_name(month)
+    cursor.execute("SELECT to_regclass(%s);", (name,))
+    if cursor.fetchone()[0] is not None:
+        return False
+
+    lower, upper = month, add_months(month, 1)
+    table = sql.Identifier(name)
+    cursor.execute(
+        sql.SQL("SELECT 1 FROM {} WHERE created_at >= %s AND created_at < %s LIMIT 1;").format(
+            sql.Identifier(DEFAULT_PARTITION)
+        ),
+        (lower, upper),
+    )
+    if cursor.fetchone() is None:
+        cursor.execute(
+            sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s);").format(
+                table, sql.Identifier(PARENT)
+            ),
+            (lower, upper),
+        )
+        return True
+
+    # CREATE ... PARTITION OF refuses while the default partition holds rows of the range
+    cursor.execute(
+        sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);").format(
+            table, sql.Identifier(PARENT)
+        )
+    )
+    cursor.execute(
+        sql.SQL(
+            """
+            WITH moved AS (
+                DELETE FROM {} WHERE created_at >= %s AND created_at < %s RETURNING *
+            )
+            INSERT INTO {} SELECT * FROM moved;
+            """
+        ).format(sql.Identifier(DEFAULT_PARTITION), table),
+        (lower, upper),
+    )
+    cursor.execute(
+        sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);").format(
+            sql.Identifier(PARENT), table
+        ),
+        (lower, upper),
+    )
+    return True
+
+
+def ensure_partitions(cursor, first_month=None, months_ahead=PARTITION_MONTHS_AHEAD, today=None):
+    """Create monthly partitions from first_month (default: this month) to months_ahead after today."""
+    current = month_start(today or date.today())
+    month = month_start(first_month) if first_month else current
+    created = []
+    while month <= add_months(current, months_ahead):
+        if create_month_partition(cursor, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def apply_retention(cursor, keep_months=PRODUCT_CLICK_RETENTION_MONTHS, drop=PRODUCT_CLICK_RETENTION_DROP, today=None):
+    """
+    Detach (or drop) partitions entirely older than keep_months before this
+    month. Returns the names handled.
+    """
+    cutoff = add_months(month_start(today or date.today()), -keep_months)
+    last_rolled_up, _ = rollups.watermark(cursor)
+    handled = []
+    for name, _, upper in list_partitions(cursor):
+        if upper > cutoff:
+            break
+        cursor.execute(
+            sql.SQL("SELECT 1 FROM {} WHERE id > %s LIMIT 1;").format(sql.Identifier(name)),
+            (last_rolled_up,),
+        )
+        if cursor.fetchone():
+            print(f"⚠ Keeping {name}: it has clicks not rolled up yet")
+            continue
+        cursor.execute(
+            sql.SQL("ALTER TABLE {} DETACH PARTITION {};").format(sql.Identifier(PARENT), sql.Identifier(name))
+        )
+        if drop:
+            cursor.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(name)))
+        handled.append(name)
+    return handled
+
+
+def try_lock(cursor):
+    """Take the maintenance lock for this transaction; False if another worker holds it."""
+    cursor.execute("SELECT pg_try_advisory_xact_lock(%s);", (PARTITION_LOCK_ID,))
+    return cursor.fetchone()[0]
+
+
+def maintain(connection):
+    """
+    Create upcoming partitions and apply retention, one transaction each.
+    Every API worker runs this; one at a time does the work, the others
+    skip it and get None.
+    """
+    with connection.cursor() as cursor:
+        if not try_lock(cursor):
+            connection.rollback()
+            return None
+        if not is_partitioned(cursor):
+            connection.rollback()
+            print(f"⚠ {PARENT} is not partitioned yet; run migrations.py")
+            return [], []
+        created = ensure_partitions(cursor)
+    connection.commit()
+    for name in created:
+        print(f"✓ Created partition {name}")
+
+    with connection.cursor() as cursor:
+        if not try_lock(cursor):
+            connection.rollback()
+            return None
+        retired = apply_retention(cursor)
+    connection.commit()
+    action = "Dropped" if PRODUCT_CLICK_RETENTION_DROP else "Detached"
+    for name in retired:
+        print(f"✓ {action} partition {name}")
+    return created, retired
+
+
+def start_background_maintenance(connect, interval=PARTITION_MAINTENANCE_INTERVAL):
+    """Daemon thread running maintain() every `interval` seconds; None if disabled."""
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            try:
+                connection = connect()
+                try:
+                    maintain(connection)
+                finally:
+                    connection.close()
+            except Exception as e:
+                print(f"⚠ Partition maintenance failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="click-partitions", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    from migrations import get_connection
+
+    conn = get_connection()
+    try:
+        if "--list" in sys.argv:
+            with conn.cursor() as cur:
+                for name, lower, upper in list_partitions(cur):
+                    print(f"{name}  {lower} .. {upper}")
+        elif maintain(conn) is None:
+            print("⚠ Another partition maintenance is running")
+    except psycopg2.Error as e:
+        print(f"✗ Error maintaining partitions: {e}")
+    finally:
+        conn.close()
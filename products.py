@@ -0,0 +1,129 @@
+"""
+Parsing of crawled Jumbo markdown into product records, and product-level
+diffs between two crawls.
+"""
+import re
+
+
+PRODUCT_PATTERN = re.compile(
+    r'!\[([^\]]+)\].*?Agregar a Mis listas \$([0-9.,]+).*?\]\((https://www.jumbo.cl/[^\)]+)\)',
+    re.IGNORECASE,
+)
+
+# Longest partial line carried over between chunks; far above any product card
+MAX_LINE_CHARS = 1 << 20
+
+
+def parse_product(match):
+    """Build a product dict from a PRODUCT_PATTERN match, or None if the price is unusable."""
+    product_name = match.group(1).strip().replace('\\', '')
+    price_str = match.group(2).strip().replace('.', '')
+    if not price_str.isdigit():
+        return None
+    return {
+        'name': product_name,
+        'price': int(price_str),
+        'url': match.group(3).strip(),
+    }
+
+
+def iter_products(chunks, max_line=MAX_LINE_CHARS):
+    """
+    Yield products from an iterable of text chunks.
+
+    A product card is always on a single line (the pattern's `.*?` does not
+    cross newlines), so the complete lines of each chunk are scanned and the
+    partial last line is carried over as a list of pieces, joined once its
+    newline arrives. A partial line growing past `max_line` characters is
+    scanned as it is and cut down to its last `max_line // 2` characters,
+    so work stays linear and memory bounded even on a page without
+    newlines; only a card longer than that could be missed.
+    """
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        cut = chunk.rfind('\n') + 1
+        if cut:
+            pending.append(chunk[:cut])
+            for match in PRODUCT_PATTERN.finditer(''.join(pending)):
+                product = parse_product(match)
+                if product:
+                    yield product
+            pending = [chunk[cut:]]
+            pending_size = len(chunk) - cut
+            continue
+
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size > max_line:
+            text = ''.join(pending)
+            end = 0
+            for match in PRODUCT_PATTERN.finditer(text):
+                product = parse_product(match)
+                if product:
+                    yield product
+                end = match.end()
+            pending = [text[max(end, len(text) - max_line // 2):]]
+            pending_size = len(pending[0])
+
+    for match in PRODUCT_PATTERN.finditer(''.join(pending)):
+        product = parse_product(match)
+        if product:
+            yield product
+
+
+def read_chunks(path, chunk_size=1 << 20):
+    """Read a text file lazily, chunk_size characters at a time."""
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def stream_products(path, chunk_size=1 << 20):
+    """Yield the products of a crawled markdown file without loading it whole."""
+    return iter_products(read_chunks(path, chunk_size))
+
+
+def extract_products(content):
+    """Return every product found in a markdown document."""
+    return list(iter_products([content]))
+
+
+def diff_products(previous, current):
+    """
+    Compare two product lists by url.
+
+    Returns {'new': [...], 'removed': [...], 'price_changed': [...]}, where
+    price_changed entries carry both 'price' and 'old_price'.
+    """
+    previous_by_url = {product['url']: product for product in previous}
+    current_by_url = {product['url']: product for product in current}
+
+    new = [product for url, product in current_by_url.items() if url not in previous_by_url]
+    removed = [product for url, product in previous_by_url.items() if url not in current_by_url]
+    price_changed = [
+        {**product, 'old_price': previous_by_url[url]['price']}
+        for url, product in current_by_url.items()
+        if url in previous_by_url and previous_by_url[url]['price'] != product['price']
+    ]
+
+    return {'new': new, 'removed': removed, 'price_changed': price_changed}
+
+
+def undo_diff(products, diff):
+    """
+    Rebuild the product list a diff was computed from. Used to fold a diff
+    that was never loaded into the next one instead of losing it.
+    """
+    removed_urls = {product['url'] for product in diff['new']}
+    old_prices = {product['url']: product['old_price'] for product in diff['price_changed']}
+
+    base = [
+        {**product, 'price': old_prices.get(product['url'], product['price'])}
+        for product in products
+        if product['url'] not in removed_urls
+    ]
+    return base + diff['removed']
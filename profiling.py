@@ -0,0 +1,155 @@
+"""
+Opt-in slow statement capture.
+
+Enabled by setting SLOW_QUERY_MS. Every statement run through an
+InstrumentedConnection is already timed (metrics.py); statements slower
+than the threshold are logged with their route and with parameters
+redacted to their types, and aggregated by statement text. For a sampled
+fraction (SLOW_QUERY_EXPLAIN_RATE, default 0.1) an
+EXPLAIN (ANALYZE, BUFFERS) plan is captured on the same connection inside a
+savepoint that is always rolled back, so neither a failing EXPLAIN nor the
+re-run breaks or changes the request; string literals in the plan are
+masked. Only plain SELECT statements inside an open transaction are
+re-executed by ANALYZE; anything else (WITH statements may modify data,
+autocommit has no savepoint to undo them) is only EXPLAINed.
+
+GET /debug/slow-queries (operator token required, see api.py OPS_TOKEN) lists
+the statements with the most total slow time.
+"""
+import logging
+import os
+import random
+import re
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+import metrics
+
+
+logger = logging.getLogger("cocina.slow_query")
+
+SLOW_QUERY_MS = os.getenv("SLOW_QUERY_MS")
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+
+# Keep the aggregate bounded; the least costly statements are dropped first
+MAX_STATEMENTS = 200
+
+WHITESPACE_RE = re.compile(r"\s+")
+SELECT_RE = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+# Plans inline the bound values ("Filter: (device_id = 'abc')")
+STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+
+
+def redact(vars):
+    """Replace parameter values with their type (and length for sequences)."""
+    if vars is None:
+        return None
+    if isinstance(vars, dict):
+        return {key: redact_value(value) for key, value in vars.items()}
+    return [redact_value(value) for value in vars]
+
+
+def redact_value(value):
+    if isinstance(value, (list, tuple)):
+        return f"<{type(value).__name__}[{len(value)}]>"
+    return f"<{type(value).__name__}>"
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms, explain_rate):
+        self.threshold = threshold_ms / 1000
+        self.explain_rate = explain_rate
+        self.statements = {}
+        self.lock = threading.Lock()
+        self.rng = random.Random()
+
+    def explain(self, cursor, query, vars):
+        """EXPLAIN the statement on the cursor's connection, inside a savepoint."""
+        connection = cursor.connection
+        in_transaction = (
+            not connection.autocommit
+            and connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        )
+        analyze = "(ANALYZE, BUFFERS) " if in_transaction and SELECT_RE.match(query) else ""
+        # A raw cursor: not instrumented, so EXPLAIN does not re-enter this hook
+        raw = psycopg2.extensions.cursor(connection)
+        try:
+            if in_transaction:
+                raw.execute("SAVEPOINT slow_query_explain")
+            raw.execute(f"EXPLAIN {analyze}{query}", vars)
+            return STRING_LITERAL_RE.sub("'?'", "\n".join(row[0] for row in raw.fetchall()))
+        except psycopg2.Error as e:
+            return f"EXPLAIN failed: {e}"
+        finally:
+            # Undo whatever the ANALYZE run did, successful or not
+            if in_transaction:
+                raw.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                raw.execute("RELEASE SAVEPOINT slow_query_explain")
+            raw.close()
+
+    def __call__(self, cursor, query, vars, seconds, route):
+        if seconds < self.threshold:
+            return
+
+        if isinstance(query, bytes):
+            query = query.decode("utf-8", "replace")
+        elif not isinstance(query, str):
+            # psycopg2.sql.Composed
+            query = query.as_string(cursor)
+        text = WHITESPACE_RE.sub(" ", query).strip()
+
+        logger.warning("Slow query %.1fms route=%s params=%s: %s", seconds * 1000, route, redact(vars), text)
+
+        plan = None
+        if self.rng.random() < self.explain_rate:
+            plan = self.explain(cursor, query, vars)
+
+        with self.lock:
+            entry = self.statements.get(text)
+            if entry is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    cheapest = min(self.statements, key=lambda key: self.statements[key]["total_ms"])
+                    del self.statements[cheapest]
+                entry = self.statements[text] = {
+                    "query": text,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "routes": set(),
+                    "last_params": None,
+                    "plan": None,
+                    "last_seen": None,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += seconds * 1000
+            entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+            entry["routes"].add(route)
+            entry["last_params"] = redact(vars)
+            entry["last_seen"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+            if plan:
+                entry["plan"] = plan
+
+    def top(self, limit=20):
+        with self.lock:
+            entries = sorted(self.statements.values(), key=lambda entry: entry["total_ms"], reverse=True)
+            return [
+                {
+                    **entry,
+                    "routes": sorted(entry["routes"]),
+                    "mean_ms": round(entry["total_ms"] / entry["count"], 2),
+                    "total_ms": round(entry["total_ms"], 2),
+                    "max_ms": round(entry["max_ms"], 2),
+                }
+                for entry in entries[:limit]
+            ]
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+
+
+slow_query_log = None
+if SLOW_QUERY_MS:
+    slow_query_log = SlowQueryLog(float(SLOW_QUERY_MS), SLOW_QUERY_EXPLAIN_RATE)
+    metrics.statement_hooks.append(slow_query_log)
@@ -0,0 +1,216 @@
+"""
+Co-occurrence recommendations: "people who have X also have" (pantries)
+and "people who clicked X also clicked" (products).
+
+A batch job builds a sparse binary user x item matrix per kind, multiplies
+it by its transpose to count the users every pair of items shares, and
+keeps the RECOMMEND_TOP_K most similar items of each item (cosine
+similarity, at least RECOMMEND_MIN_SUPPORT shared users) in item_neighbor:
+one row per item holding its neighbor ids and scores as arrays, so the API
+answers with a primary key lookup.
+
+Clicks are first folded into user_product_click (one row per user and
+product) after a watermark in rollup_watermark, the same way rollups.py
+does. The incremental mode folds in the new clicks and recomputes only the
+products clicked by the users who clicked since the last run; other
+products listing one of those keep slightly stale scores until the next
+full run. Pantries are only recomputed by full runs.
+
+Needs numpy and scipy (in requirements.txt); the API only reads the tables.
+
+Usage:
+    python recommend.py                 # fold in clicks, recompute everything
+    python recommend.py --incremental   # fold in new clicks, refresh the products they touch
+"""
+import os
+import sys
+import time
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+from scipy import sparse
+import rollups
+
+RECOMMEND_TOP_K = int(os.getenv("RECOMMEND_TOP_K", "20"))
+RECOMMEND_MIN_SUPPORT = int(os.getenv("RECOMMEND_MIN_SUPPORT", "2"))
+
+RECOMMEND_LOCK_ID = 4_310_003
+WATERMARK_NAME = "user_product_click"
+
+# kind -> query returning the (user_id, item_id) pairs of the matrix
+PAIRS = {
+    "ingredient": "SELECT user_id, ingredient_id FROM user_ingredient;",
+    "product": "SELECT user_id, product_id FROM user_product_click;",
+}
+
+
+def fold_clicks(cursor, settle_seconds=rollups.ROLLUP_SETTLE_SECONDS):
+    """
+    Fold settled clicks past the watermark into user_product_click and move
+    the watermark. Returns the products clicked by the users who clicked.
+    """
+    cursor.execute(
+        """
+        INSERT INTO rollup_watermark (name, last_id) VALUES (%s, 0)
+        ON CONFLICT (name) DO NOTHING;
+        """,
+        (WATERMARK_NAME,),
+    )
+    cursor.execute("SELECT last_id FROM rollup_watermark WHERE name = %s;", (WATERMARK_NAME,))
+    first_id = cursor.fetchone()[0]
+    cursor.execute(
+        """
+        SELECT MAX(id) FROM product_click
+        WHERE id > %s AND created_at < CURRENT_TIMESTAMP - make_interval(secs => %s);
+        """,
+        (first_id, settle_seconds),
+    )
+    last_id = cursor.fetchone()[0]
+    if last_id is None:
+        return []
+
+    cursor.execute(
+        """
+        INSERT INTO user_product_click (user_id, product_id, clicks)
+        SELECT user_id, product_id, COUNT(*)
+        FROM product_click
+        WHERE id > %s AND id <= %s
+        GROUP BY 1, 2
+        ON CONFLICT (user_id, product_id)
+        DO UPDATE SET clicks = user_product_click.clicks + EXCLUDED.clicks;
+        """,
+        (first_id, last_id),
+    )
+    cursor.execute(
+        "UPDATE rollup_watermark SET last_id = %s, updated_at = CURRENT_TIMESTAMP WHERE name = %s;",
+        (last_id, WATERMARK_NAME),
+    )
+    cursor.execute(
+        """
+        SELECT DISTINCT product_id FROM user_product_click
+        WHERE user_id IN (SELECT user_id FROM product_click WHERE id > %s AND id <= %s);
+        """,
+        (first_id, last_id),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def user_item_matrix(pairs):
+    """Binary CSC matrix (users x items) from (user_id, item_id) pairs, and the item id of each column."""
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    user_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    item_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)), shape=(len(user_ids), len(item_ids)),
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, item_ids
+
+
+def top_neighbors(matrix, item_ids, only=None, top_k=RECOMMEND_TOP_K, min_support=RECOMMEND_MIN_SUPPORT):
+    """
+    {item id: (neighbor ids, scores)} by cosine similarity of the matrix
+    columns, best first, for every item or only the ids in `only`.
+    """
+    if only is None:
+        columns = np.arange(len(item_ids))
+    else:
+        columns = np.flatnonzero(np.isin(item_ids, np.asarray(list(only), dtype=np.int64)))
+    if not len(columns):
+        return {}
+
+    # Shared users of each selected item with every item; users per item on the diagonal
+    counts = (matrix[:, columns].T @ matrix).tocsr()
+    users_per_item = np.asarray(matrix.sum(axis=0)).ravel()
+
+    neighbors = {}
+    for row, column in enumerate(columns):
+        start, end = counts.indptr[row], counts.indptr[row + 1]
+        others, shared = counts.indices[start:end], counts.data[start:end]
+        keep = (others != column) & (shared >= min_support)
+        others, shared = others[keep], shared[keep]
+        if not len(others):
+            neighbors[int(item_ids[column])] = ([], [])
+            continue
+        scores = shared / np.sqrt(users_per_item[column] * users_per_item[others])
+        if len(scores) > top_k:
+            # Everything scoring at least the k-th best, ties at the boundary included
+            kth = -np.partition(-scores, top_k - 1)[top_k - 1]
+            best = scores >= kth
+            others, scores = others[best], scores[best]
+        # Best first, ties by item id, so reruns and rebuilds give the same lists
+        order = np.lexsort((item_ids[others], -scores))[:top_k]
+        neighbors[int(item_ids[column])] = (
+            [int(i) for i in item_ids[others[order]]],
+            [round(float(s), 4) for s in scores[order]],
+        )
+    return neighbors
+
+
+def store(cursor, kind, neighbors, replace=False):
+    """Write neighbor lists; items left without neighbors lose their row. replace drops every other row of kind."""
+    if replace:
+        cursor.execute("DELETE FROM item_neighbor WHERE kind = %s;", (kind,))
+    else:
+        cursor.execute(
+            "DELETE FROM item_neighbor WHERE kind = %s AND item_id = ANY(%s);",
+            (kind, [item for item, (ids, _) in neighbors.items() if not ids]),
+        )
+    rows = [(kind, item, ids, scores) for item, (ids, scores) in neighbors.items() if ids]
+    execute_values(
+        cursor,
+        """
+        INSERT INTO item_neighbor (kind, item_id, neighbor_ids, scores) VALUES %s
+        ON CONFLICT (kind, item_id) DO UPDATE
+        SET neighbor_ids = EXCLUDED.neighbor_ids, scores = EXCLUDED.scores, updated_at = CURRENT_TIMESTAMP;
+        """,
+        rows,
+        template="(%s, %s, %s::int[], %s::real[])",
+    )
+    return len(rows)
+
+
+def compute(cursor, kind, only=None):
+    cursor.execute(PAIRS[kind])
+    matrix, item_ids = user_item_matrix(cursor.fetchall())
+    return top_neighbors(matrix, item_ids, only)
+
+
+def refresh(connection, incremental=False):
+    """
+    Recompute the neighbor tables in one transaction. Returns {kind: items
+    written}, or None if another run holds the lock.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s);", (RECOMMEND_LOCK_ID,))
+        if not cursor.fetchone()[0]:
+            connection.rollback()
+            return None
+
+        touched = fold_clicks(cursor)
+        if incremental:
+            written = {"product": store(cursor, "product", compute(cursor, "product", touched))}
+        else:
+            written = {kind: store(cursor, kind, compute(cursor, kind), replace=True) for kind in PAIRS}
+    connection.commit()
+    return written
+
+
+if __name__ == "__main__":
+    from migrations import get_connection
+
+    conn = get_connection()
+    try:
+        started = time.perf_counter()
+        written = refresh(conn, incremental="--incremental" in sys.argv)
+        if written is None:
+            print("⚠ Another recommendation refresh is running")
+        else:
+            for kind, count in written.items():
+                print(f"✓ Stored neighbors of {count} {kind}s")
+            print(f"✓ Done in {time.perf_counter() - started:.1f}s")
+    except psycopg2.Error as e:
+        print(f"✗ Error refreshing recommendations: {e}")
+    finally:
+        conn.close()
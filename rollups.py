@@ -0,0 +1,201 @@
+"""
+Incremental product_click rollups.
+
+product_click is append-only, so clicks are folded into hourly and daily
+count tables (per product and per ingredient) in id order, after a
+watermark stored in rollup_watermark. Each run aggregates the new rows in
+one statement and upserts the counts, moving the watermark in the same
+transaction, so a crash never counts a click twice.
+
+Click ids come from a sequence and are handed out before commit, so a
+higher id can become visible before a lower one. Rows are only folded in
+once they are ROLLUP_SETTLE_SECONDS old; inserts in /product-clicks commit
+well within that.
+
+The API runs `start_background_aggregator()` at startup (every
+ROLLUP_INTERVAL seconds, 0 disables it). Several instances may run it:
+a transaction-level advisory lock lets only one of them work at a time.
+
+Usage:
+    python rollups.py           # fold in pending clicks once
+    python rollups.py --rebuild # recompute every rollup from product_click
+"""
+import os
+import sys
+import threading
+import time
+import psycopg2
+
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "60"))
+ROLLUP_SETTLE_SECONDS = int(os.getenv("ROLLUP_SETTLE_SECONDS", "30"))
+ROLLUP_BATCH_SIZE = 50_000
+
+ROLLUP_LOCK_ID = 4_310_002
+WATERMARK_NAME = "product_click"
+
+# (table, bucket expression); product and ingredient rollups per period
+PERIODS = {
+    "hour": "date_trunc('hour', c.created_at)",
+    "day": "date_trunc('day', c.created_at)::date",
+}
+
+
+def rollup_statements(first_id, last_id):
+    """Upserts folding clicks with first_id < id <= last_id into every rollup."""
+    statements = []
+    for period, bucket in PERIODS.items():
+        statements.append((
+            f"""
+            INSERT INTO product_click_{period} (bucket, product_id, clicks)
+            SELECT {bucket}, c.product_id, COUNT(*)
+            FROM product_click c
+            WHERE c.id > %s AND c.id <= %s
+            GROUP BY 1, 2
+            ON CONFLICT (bucket, product_id)
+            DO UPDATE SET clicks = product_click_{period}.clicks + EXCLUDED.clicks;
+            """,
+            (first_id, last_id),
+        ))
+        statements.append((
+            f"""
+            INSERT INTO ingredient_click_{period} (bucket, ingredient_id, clicks)
+            SELECT {bucket}, p.ingredient_id, COUNT(*)
+            FROM product_click c
+            JOIN product p ON p.id = c.product_id
+            WHERE c.id > %s AND c.id <= %s AND p.ingredient_id IS NOT NULL
+            GROUP BY 1, 2
+            ON CONFLICT (bucket, ingredient_id)
+            DO UPDATE SET clicks = ingredient_click_{period}.clicks + EXCLUDED.clicks;
+            """,
+            (first_id, last_id),
+        ))
+    return statements
+
+
+def rollup_once(connection, batch_size=ROLLUP_BATCH_SIZE, settle_seconds=ROLLUP_SETTLE_SECONDS):
+    """
+    Fold up to batch_size settled clicks past the watermark into the rollups.
+    Returns the number of clicks processed, or None if another run holds the lock.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s);", (ROLLUP_LOCK_ID,))
+        if not cursor.fetchone()[0]:
+            connection.rollback()
+            return None
+
+        cursor.execute(
+            """
+            INSERT INTO rollup_watermark (name, last_id) VALUES (%s, 0)
+            ON CONFLICT (name) DO NOTHING;
+            """,
+            (WATERMARK_NAME,),
+        )
+        cursor.execute("SELECT last_id FROM rollup_watermark WHERE name = %s;", (WATERMARK_NAME,))
+        first_id = cursor.fetchone()[0]
+
+        # Upper bound of this batch: the batch_size-th settled click past the watermark
+        cursor.execute(
+            """
+            SELECT MAX(id), COUNT(*) FROM (
+                SELECT id FROM product_click
+                WHERE id > %s AND created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                ORDER BY id
+                LIMIT %s
+            ) batch;
+            """,
+            (first_id, settle_seconds, batch_size),
+        )
+        last_id, count = cursor.fetchone()
+        if not count:
+            connection.rollback()
+            return 0
+
+        for statement, params in rollup_statements(first_id, last_id):
+            cursor.execute(statement, params)
+        cursor.execute(
+            "UPDATE rollup_watermark SET last_id = %s, updated_at = CURRENT_TIMESTAMP WHERE name = %s;",
+            (last_id, WATERMARK_NAME),
+        )
+    connection.commit()
+    return count
+
+
+def rollup_pending(connection, batch_size=ROLLUP_BATCH_SIZE, settle_seconds=ROLLUP_SETTLE_SECONDS):
+    """Run rollup_once until no settled clicks are left. Returns the total processed."""
+    total = 0
+    while True:
+        processed = rollup_once(connection, batch_size, settle_seconds)
+        if not processed:
+            return total
+        total += processed
+
+
+def rebuild(connection):
+    """Recompute every rollup from scratch (e.g. after product.ingredient_id changes)."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (ROLLUP_LOCK_ID,))
+        for period in PERIODS:
+            cursor.execute(f"TRUNCATE product_click_{period}, ingredient_click_{period};")
+        cursor.execute(
+            """
+            INSERT INTO rollup_watermark (name, last_id) VALUES (%s, 0)
+            ON CONFLICT (name) DO UPDATE SET last_id = 0, updated_at = CURRENT_TIMESTAMP;
+            """,
+            (WATERMARK_NAME,),
+        )
+    connection.commit()
+    return rollup_pending(connection)
+
+
+def watermark(cursor):
+    """(last folded click id, time of the last run), or (0, None) before the first run."""
+    cursor.execute("SELECT last_id, updated_at FROM rollup_watermark WHERE name = %s;", (WATERMARK_NAME,))
+    row = cursor.fetchone()
+    if row is None:
+        return 0, None
+    if isinstance(row, dict):
+        return row["last_id"], row["updated_at"]
+    return row
+
+
+def start_background_aggregator(connect, interval=ROLLUP_INTERVAL):
+    """
+    Daemon thread folding in new clicks every `interval` seconds, using
+    connections from `connect()`. Returns the thread, or None if disabled.
+    """
+    if interval <= 0:
+        return None
+
+    def loop():
+        while True:
+            try:
+                connection = connect()
+                try:
+                    processed = rollup_pending(connection)
+                    if processed:
+                        print(f"✓ Rolled up {processed} product clicks")
+                finally:
+                    connection.close()
+            except Exception as e:
+                print(f"⚠ Click rollup failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="click-rollups", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    from migrations import get_connection
+
+    conn = get_connection()
+    try:
+        if "--rebuild" in sys.argv:
+            processed = rebuild(conn)
+        else:
+            processed = rollup_pending(conn)
+        print(f"✓ Rolled up {processed or 0} product clicks")
+    except psycopg2.Error as e:
+        print(f"✗ Error rolling up product clicks: {e}")
+    finally:
+        conn.close()
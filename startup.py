@@ -0,0 +1,170 @@
+"""
+Startup profile of the API.
+
+Imports api.py and runs its startup handlers in a child process started
+with `python -X importtime`, then reports:
+- the import time of each module api.py imports (cumulative: including
+  everything that module imports), slowest first;
+- the startup stages api.py times (catalog snapshot, suggestion index,
+  time to ready);
+- the resident memory once ready, and whether the LLM stack got loaded.
+
+Background work (click rollups, partition maintenance, catalog polling,
+the LLM warm-up) is disabled in the child, so only startup is measured.
+The API itself logs its time to ready and resident memory at startup.
+
+Usage:
+    python startup.py
+    python startup.py --out startup_results/new.json
+    python startup.py --compare startup_results/old.json startup_results/new.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MARKER = "startup-profile: imported"
+
+CHILD = f"""
+import sys
+import time
+started = time.perf_counter()
+import api
+imported = time.perf_counter()
+print({MARKER!r}, file=sys.stderr, flush=True)
+
+import asyncio
+import json
+import metrics
+asyncio.run(api.app.router.startup())
+json.dump({{
+    "import_seconds": imported - started,
+    "stages": api.startup_stages,
+    "resident_memory": metrics.resident_memory(),
+    "modules": len(sys.modules),
+    "llm_loaded": any(name in sys.modules for name in api.LLM_MODULES),
+}}, sys.stdout)
+"""
+
+CHILD_ENV = {
+    "ROLLUP_INTERVAL": "0",
+    "PARTITION_MAINTENANCE_INTERVAL": "0",
+    "CATALOG_REFRESH_INTERVAL": "0",
+    "LLM_WARMUP_DELAY": "0",
+}
+
+
+def parse_importtime(lines, root="api"):
+    """{module: cumulative seconds} of the modules `root` imports directly."""
+    entries = []
+    for line in lines:
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative) / 1_000_000))
+
+    # A module's line comes after the lines of what it imports
+    for position, (depth, name, _) in enumerate(entries):
+        if name == root:
+            children = {}
+            for child_depth, child, seconds in reversed(entries[:position]):
+                if child_depth <= depth:
+                    break
+                if child_depth == depth + 1:
+                    children[child] = seconds
+            return children
+    return {}
+
+
+def profile():
+    environment = dict(os.environ, **CHILD_ENV)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=environment,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "child failed")
+
+    stderr = completed.stderr.splitlines()
+    imports = parse_importtime(stderr[:stderr.index(MARKER)] if MARKER in stderr else stderr)
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report["imports"] = dict(sorted(imports.items(), key=lambda item: -item[1]))
+    return report
+
+
+def print_report(report, top):
+    print(f"import api: {report['import_seconds'] * 1000:.0f}ms, {report['modules']} modules loaded")
+    for name, seconds in list(report["imports"].items())[:top]:
+        print(f"  {seconds * 1000:>8.1f}ms  {name}")
+    stages = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in report["stages"].items())
+    print(f"startup: {stages}")
+    print(f"resident memory: {report['resident_memory'] / 2 ** 20:.1f} MiB")
+    print(f"LLM stack loaded at startup: {'yes' if report['llm_loaded'] else 'no'}")
+
+
+def compare(old_path, new_path):
+    """Print the change of the totals and of every import between two reports."""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+
+    def line(label, before, after, unit, scale):
+        change = (after - before) / before * 100 if before else 0.0
+        flag = "⚠" if change > 10 else " "
+        print(f" {flag} {label:<40} {before * scale:>9.1f}{unit} -> {after * scale:>9.1f}{unit} ({change:+.1f}%)")
+
+    print(f"{old.get('commit', old_path)} -> {new.get('commit', new_path)}")
+    line("import api", old["import_seconds"], new["import_seconds"], "ms", 1000)
+    line("ready", old["stages"].get("ready", 0), new["stages"].get("ready", 0), "ms", 1000)
+    line("resident memory", old["resident_memory"], new["resident_memory"], "MiB", 1 / 2 ** 20)
+    for name in sorted(set(old["imports"]) | set(new["imports"]), key=lambda n: -new["imports"].get(n, 0)):
+        line(f"  {name}", old["imports"].get(name, 0), new["imports"].get(name, 0), "ms", 1000)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="imports to list")
+    parser.add_argument("--out", default=None, help="save the report as JSON")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    try:
+        report = profile()
+    except RuntimeError as e:
+        print(f"✗ Error profiling startup: {e}")
+        sys.exit(1)
+    report["commit"] = git_commit()
+    report["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    print_report(report, args.top)
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+In-memory prefix index for ingredient autocomplete.
+
+Every word start of each ingredient's English and Spanish name is kept,
+lowercased and accent-folded, in one sorted list per language, so the
+names matching a typed prefix are a contiguous slice found with two
+bisects. Matches ranked: names that start with the prefix before names
+with a later word starting with it, then by popularity (recipes using
+the ingredient plus pantries holding it), then shorter names.
+"""
+from bisect import bisect_left
+import re
+import threading
+import time
+from matcher import fold_accents
+
+WORD_START_RE = re.compile(r"(?:^|(?<=[\s\-(/]))\w", re.UNICODE)
+
+# Sorts after any character a normalized prefix can end with
+PREFIX_END = "\uffff"
+
+
+def normalize_prefix(text):
+    """Lowercase, fold accents and collapse whitespace: '  Limón  Sut' -> 'limon sut'."""
+    return " ".join(fold_accents((text or "").lower()).split())
+
+
+class PrefixIndex:
+    def __init__(self, ingredients):
+        """ingredients: iterable of dicts with id, name, name_es, img_url and popularity."""
+        self.ingredients = {}
+        self.popularity = {}
+        # language -> (sorted keys, ingredient id and word position per key)
+        self.languages = {}
+
+        entries = {"en": [], "es": []}
+        for ingredient in ingredients:
+            ingredient = dict(ingredient)
+            self.popularity[ingredient["id"]] = ingredient.pop("popularity", 0)
+            self.ingredients[ingredient["id"]] = ingredient
+            for language, label in (("en", ingredient["name"]), ("es", ingredient["name_es"] or ingredient["name"])):
+                normalized = normalize_prefix(label)
+                for position, match in enumerate(WORD_START_RE.finditer(normalized)):
+                    entries[language].append((normalized[match.start():], ingredient["id"], position))
+
+        for language, items in entries.items():
+            items.sort()
+            self.languages[language] = ([key for key, _, _ in items], [(i, p) for _, i, p in items])
+
+    def __len__(self):
+        return len(self.ingredients)
+
+    def suggest(self, prefix, language="en", limit=10):
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        keys, targets = self.languages[language]
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + PREFIX_END, lo=start)
+
+        # Best (lowest) word position per ingredient
+        positions = {}
+        for ingredient_id, position in targets[start:end]:
+            if position < positions.get(ingredient_id, len(keys)):
+                positions[ingredient_id] = position
+
+        label = "name" if language == "en" else "name_es"
+        ranked = sorted(
+            positions,
+            key=lambda i: (
+                positions[i] > 0,
+                -self.popularity[i],
+                len(self.ingredients[i][label] or self.ingredients[i]["name"]),
+                i,
+            ),
+        )
+        return [self.ingredients[i] for i in ranked[:limit]]
+
+
+class CatalogIndex:
+    """
+    Holds an index built from the catalog by `build()`. It is rebuilt when
+    `version()` changes (checked at most every `check_interval` seconds) or
+    once it is `max_age` seconds old. Requests keep using the previous index
+    while one thread rebuilds it.
+    """
+
+    def __init__(self, build, version, max_age, check_interval=1.0):
+        self.build = build
+        self.version = version
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.index = None
+        self.built_version = None
+        self.built_at = 0.0
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self.index is not None and now - self.checked_at < self.check_interval:
+            return self.index
+
+        if self.index is not None and not self.lock.acquire(blocking=False):
+            return self.index
+        if self.index is None:
+            self.lock.acquire()
+        try:
+            self.checked_at = now
+            version = self.version()
+            if self.index is None or version != self.built_version or now - self.built_at >= self.max_age:
+                try:
+                    self.index = self.build()
+                except Exception as e:
+                    if self.index is None:
+                        raise
+                    print(f"⚠ Keeping the previous index, rebuild failed: {e}")
+                    return self.index
+                self.built_version = version
+                self.built_at = now
+            return self.index
+        finally:
+            self.lock.release()
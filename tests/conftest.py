@@ -0,0 +1,9 @@
+"""
+Unit tests that need no database: python -m pytest tests (needs pytest,
+and httpx for the API tests).
+"""
+import os
+import sys
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
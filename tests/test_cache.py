@@ -0,0 +1,168 @@
+import threading
+import time
+import pytest
+from cache import MemoryCache, RedisCache, SingleFlight
+
+
+class LocalRedis:
+    """Stand-in for redis.Redis: the get/set/incr/info subset RedisCache uses."""
+
+    def __init__(self):
+        self.values = {}
+        self.down = False
+
+    def check(self):
+        if self.down:
+            raise ConnectionError("server unreachable")
+
+    def get(self, key):
+        self.check()
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.check()
+        self.values[key] = value.encode() if isinstance(value, str) else value
+
+    def incr(self, key):
+        self.check()
+        self.values[key] = str(int(self.values.get(key, 0)) + 1).encode()
+
+    def info(self, section):
+        self.check()
+        return {"keyspace_hits": 0, "keyspace_misses": 0, "evicted_keys": 0, "expired_keys": 0}
+
+
+@pytest.fixture(params=["memory", "redis"])
+def cache(request):
+    if request.param == "memory":
+        return MemoryCache(max_entries=100, prefix="test")
+    return RedisCache(LocalRedis(), prefix="test")
+
+
+def counts(cache, namespace):
+    return cache.stats()["namespaces"].get(namespace, {})
+
+
+def test_get_set_and_miss(cache):
+    assert cache.get("recipes", "a") is None
+    cache.set("recipes", "a", {"ids": [1, 2]})
+    assert cache.get("recipes", "a") == {"ids": [1, 2]}
+    assert counts(cache, "recipes") == {"miss": 1, "set": 1, "hit": 1}
+
+
+def test_invalidate_drops_only_its_namespace(cache):
+    cache.set("recipes", "a", 1)
+    cache.set("search", "a", 2)
+    cache.invalidate("recipes")
+    assert cache.get("recipes", "a") is None
+    assert cache.get("search", "a") == 2
+
+
+def test_get_or_set_computes_once(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [1, 2, 3]
+
+    assert cache.get_or_set("recipes", "k", compute) == [1, 2, 3]
+    assert cache.get_or_set("recipes", "k", compute) == [1, 2, 3]
+    assert len(calls) == 1
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache(prefix="test")
+    cache.set("scan", "a", 1, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("scan", "a") is None
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2, prefix="test")
+    cache.set("search", "a", 1)
+    cache.set("search", "b", 2)
+    cache.get("search", "a")
+    cache.set("search", "c", 3)
+    assert cache.get("search", "b") is None
+    assert cache.get("search", "a") == 1
+    assert counts(cache, "search")["eviction"] == 1
+
+
+def test_unreachable_server_degrades_to_a_miss():
+    client = LocalRedis()
+    cache = RedisCache(client, prefix="test")
+    cache.set("recipes", "a", 1)
+    client.down = True
+
+    assert cache.get("recipes", "a") is None
+    cache.set("recipes", "b", 2)
+    assert cache.get_or_set("recipes", "c", lambda: 3) == 3
+    assert counts(cache, "recipes")["error"] == 4
+    assert cache.stats()["server"] is None
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    def call():
+        results.append(flights.do("key", compute))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=call) for _ in range(5)]
+    for thread in followers:
+        thread.start()
+    # Followers are waiting on the leader's call
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [("value", False)] + [("value", True)] * 5
+    assert flights.calls == {}
+
+
+def test_single_flight_shares_errors_and_forgets_the_call():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flights.do("key", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    started.wait(5)
+    threads += [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 4
+    assert flights.calls == {}
+    # The next call runs again instead of reusing the failure
+    assert flights.do("key", lambda: 1) == (1, False)
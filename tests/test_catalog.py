@@ -0,0 +1,129 @@
+import math
+import os
+import pytest
+from catalog import HEADER, SharedCatalog, Snapshot, encode, snapshot_path, write_file
+
+TABLES = {
+    "ingredient": [
+        (1, "tomato", "tomate", None, [10, 11]),
+        (4, "salt", None, "salt.png", []),
+    ],
+    "recipe": [
+        (7, "salad", 5, 4.5, "Mix.", None, None, "ensalada", "Mezclar.", [1, 4]),
+        (9, "brine", None, None, "Stir.", None, None, None, None, [4]),
+    ],
+    "product": [
+        (10, "Tomato 1kg", 1990, "https://example.com/10", 1),
+        (11, "Cherry tomato", None, "https://example.com/11", 1),
+    ],
+}
+
+
+@pytest.fixture
+def snapshot_file(tmp_path):
+    path = str(tmp_path / "catalog.bin")
+    write_file(path, encode(3, TABLES))
+    return path
+
+
+def test_roundtrip(snapshot_file):
+    snapshot = Snapshot(snapshot_file)
+    assert snapshot.version == 3
+    assert snapshot.ingredients() == [
+        {"id": 1, "name": "tomato", "name_es": "tomate", "img_url": None},
+        {"id": 4, "name": "salt", "name_es": None, "img_url": "salt.png"},
+    ]
+    assert snapshot.ingredient(2) is None
+    salad = snapshot.recipe(7)
+    assert salad["name_es"] == "ensalada" and salad["rating"] == 4.5 and salad["ingredient_ids"] == [1, 4]
+    brine = snapshot.recipe(9)
+    assert brine["minutes"] is None and brine["rating"] is None and brine["video_url"] is None
+    assert snapshot.recipe_uses() == {1: 1, 4: 2}
+    assert [p["price"] for p in snapshot.products_for(1)] == [1990, None]
+    assert snapshot.products_for(4) == []
+
+
+def test_empty_tables(tmp_path):
+    path = str(tmp_path / "empty.bin")
+    write_file(path, encode(1, {table: [] for table in TABLES}))
+    snapshot = Snapshot(path)
+    assert snapshot.ingredients() == [] and snapshot.recipe_uses() == {}
+
+
+def test_checksum_mismatch(snapshot_file):
+    with open(snapshot_file, "r+b") as f:
+        f.seek(HEADER.size + 40)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    with pytest.raises(ValueError, match="checksum"):
+        Snapshot(snapshot_file)
+
+
+def test_not_a_snapshot(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"x" * 64)
+    with pytest.raises(ValueError, match="not a catalog snapshot"):
+        Snapshot(str(path))
+
+
+def unreachable():
+    raise AssertionError("the database should not be read")
+
+
+def shared(tmp_path, export_path=None, connect=unreachable):
+    catalog = SharedCatalog(connect, directory=str(tmp_path), export_path=export_path)
+    catalog.directory = str(tmp_path / "db")
+    os.makedirs(catalog.directory)
+    return catalog
+
+
+def test_attach_existing(tmp_path):
+    catalog = shared(tmp_path)
+    write_file(snapshot_path(catalog.directory, 3), encode(3, TABLES))
+    assert catalog.attach(3).version == 3
+    assert catalog.source == "shared"
+
+
+def test_attach_missing_uses_export(tmp_path, snapshot_file):
+    catalog = shared(tmp_path, export_path=snapshot_file)
+    write_file(snapshot_path(catalog.directory, 2), encode(2, TABLES))
+    assert catalog.attach(3).version == 3
+    assert catalog.source == "export"
+    # Older versions are removed once the new one is in place
+    assert sorted(os.listdir(catalog.directory)) == ["catalog-3.bin", "catalog.lock"]
+
+
+def test_attach_rewrites_corrupt_file(tmp_path, snapshot_file):
+    catalog = shared(tmp_path, export_path=snapshot_file)
+    with open(snapshot_path(catalog.directory, 3), "wb") as f:
+        f.write(b"\0" * 64)
+    assert catalog.attach(3).ingredient(1)["name"] == "tomato"
+    assert catalog.source == "export"
+
+
+def test_attach_stale_export_reads_database(tmp_path, snapshot_file, monkeypatch):
+    import catalog as catalog_module
+
+    def write_snapshot(connection, directory):
+        path = snapshot_path(directory, 4)
+        write_file(path, encode(4, TABLES))
+        return path
+
+    closed = []
+
+    class Connection:
+        def close(self):
+            closed.append(True)
+
+    monkeypatch.setattr(catalog_module, "write_snapshot", write_snapshot)
+    catalog = shared(tmp_path, export_path=snapshot_file, connect=Connection)
+    assert catalog.attach(4).version == 4
+    assert catalog.source == "database" and closed == [True]
+
+
+def test_nan_rating_reads_as_none(tmp_path):
+    tables = dict(TABLES, recipe=[(1, "r", 1, math.nan, None, None, None, None, None, [])])
+    path = str(tmp_path / "nan.bin")
+    write_file(path, encode(1, tables))
+    assert Snapshot(path).recipe(1)["rating"] is None
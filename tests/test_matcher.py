@@ -0,0 +1,66 @@
+import pytest
+from matcher import IngredientMatcher, normalize, stem
+
+INGREDIENTS = [
+    (1, "Tomato", "Tomate"),
+    (2, "Beef tomatoes", "Tomate beef"),
+    (3, "Lemon", "Limón"),
+    (4, "Lemons", "Limones"),
+    (5, "Chicken breast", "Pechuga de pollo"),
+    (6, "Chicken", "Pollo"),
+    (7, "Yogurt", "Yogur"),
+    (8, "Greek Yogurt", "Yogur griego"),
+    (9, "Onion", "Cebolla"),
+    (10, "Garlic", "Ajo"),
+]
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return IngredientMatcher(INGREDIENTS)
+
+
+def test_normalize():
+    assert normalize("Limón Malla 1 kg") == ["limon"]
+    assert normalize(None) == []
+    assert stem("limones") == "limon" and stem("tomates") == "tomate" and stem("cress") == "cress"
+
+
+@pytest.mark.parametrize("name, ingredient_id", [
+    ("Tomate Larga Vida Granel", 1),
+    ("Tomate Beef Granel", 2),
+    ("Pechuga de Pollo Deshuesada Bandeja 1 kg", 5),
+    ("Pollo Entero", 6),
+    # Catalog duplicates resolve to the plainest label
+    ("Limón Malla 1 kg", 3),
+    # A typo in the leading word falls back to trigrams
+    ("Cebola Morada", 9),
+])
+def test_match(matcher, name, ingredient_id):
+    result = matcher.match(name)
+    assert result is not None and result[0] == ingredient_id
+    assert result[1] >= 0.9
+
+
+@pytest.mark.parametrize("name, generic_id", [
+    # "griego" qualifies "yogur", so plain Yogurt is left for the LLM
+    ("Yogurt Griego Danone Oikos Natural Sin Endulzar 150 g", 7),
+    # "coctel" names a variety even with no such ingredient in the catalog
+    ("Tomate Cóctel Pote 250 g", 1),
+])
+def test_qualified_names_stay_below_confidence(matcher, name, generic_id):
+    result = matcher.match(name)
+    assert result is None or result[0] != generic_id or result[1] < 0.9
+
+
+@pytest.mark.parametrize("name", ["Bolsa 1 kg", "Detergente Líquido"])
+def test_unknown(matcher, name):
+    assert matcher.match(name) is None
+
+
+def test_match_all(matcher):
+    products = [{"name": "Tomate Larga Vida"}, {"name": "Detergente"}]
+    matched, leftovers = matcher.match_all(products)
+    assert [(p["name"], p["ingredient_id"]) for p in matched] == [("Tomate Larga Vida", 1)]
+    assert matched[0]["match_confidence"] >= 0.9
+    assert leftovers == [{"name": "Detergente"}]
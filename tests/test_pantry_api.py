@@ -0,0 +1,139 @@
+import pytest
+from fastapi.testclient import TestClient
+import api
+
+
+class Cursor:
+    """Answers each execute() with the next scripted (SQL fragment, rows) pair."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        assert self.connection.script, f"unexpected query: {query}"
+        fragment, self.rows = self.connection.script.pop(0)
+        assert fragment in query, f"expected {fragment!r} in {query}"
+        self.connection.executed.append(fragment)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class Connection:
+    def __init__(self, script):
+        self.script = list(script)
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self, cursor_factory=None):
+        return Cursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    """connect(script) makes the API's next connection answer with `script`."""
+
+    def connect(script):
+        connection = Connection(script)
+        monkeypatch.setattr(api, "get_db_connection", lambda: connection)
+        return connection
+
+    return connect
+
+
+@pytest.fixture
+def client():
+    # No `with`: the startup hooks (warm-up, background threads) do not run
+    return TestClient(api.app)
+
+
+EXISTING_USER = ('SELECT id FROM "user" WHERE device_id', [{"id": 5}])
+
+
+def test_put_unknown_ids_creates_nothing(connect, client):
+    connection = connect([("AS unknown", [{"unknown": [998, 999]}])])
+    response = client.put("/ingredients/new-device", json=[1, 998, 999])
+    assert response.status_code == 404
+    assert "[998, 999]" in response.json()["detail"]
+    # The user lookup (and its insert) never ran
+    assert connection.executed == ["AS unknown"] and connection.commits == 0
+
+
+def test_put_returns_the_diff_and_version(connect, client):
+    connection = connect([
+        ("AS unknown", [{"unknown": None}]),
+        EXISTING_USER,
+        ("FOR UPDATE", [{"id": 5}]),
+        ("WITH desired", [{"added": [3], "removed": [1]}]),
+        ("SELECT pantry_version", [{"pantry_version": 9}]),
+    ])
+    response = client.put("/ingredients/device", json=[2, 3])
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "added": [3], "removed": [1], "pantry_version": 9}
+    assert connection.commits == 1 and not connection.script
+
+
+def test_get_current_version_is_not_modified(connect, client):
+    connect([EXISTING_USER, ("SELECT pantry_version", [{"pantry_version": 7}])])
+    response = client.get("/ingredients/device", params={"since": 7})
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"7"'
+
+    connect([EXISTING_USER, ("SELECT pantry_version", [{"pantry_version": 7}])])
+    response = client.get("/ingredients/device", headers={"If-None-Match": '"7"'})
+    assert response.status_code == 304
+
+
+def test_get_since_returns_the_net_delta(connect, client):
+    # A replace that added 3 and removed 1 moved the version from 7 to 9,
+    # one bump per side; 4 was added at 8 and removed again at 9.
+    connect([
+        EXISTING_USER,
+        ("SELECT pantry_version", [{"pantry_version": 9}]),
+        ("MIN(version) AS oldest", [{"oldest": 2}]),
+        ("FROM pantry_change", [
+            {"ingredient_id": 1, "first_added": False, "last_added": False},
+            {"ingredient_id": 3, "first_added": True, "last_added": True},
+            {"ingredient_id": 4, "first_added": True, "last_added": False},
+        ]),
+    ])
+    response = client.get("/ingredients/device", params={"since": 7})
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"9"'
+    assert response.json() == {"version": 9, "added": [3], "removed": [1]}
+
+
+def test_get_since_beyond_history_resets(connect, client):
+    pantry = [{"id": 3, "name": "egg", "name_es": "huevo", "img_url": None}]
+    connect([
+        EXISTING_USER,
+        ("SELECT pantry_version", [{"pantry_version": 40}]),
+        ("MIN(version) AS oldest", [{"oldest": 30}]),
+        ("JOIN user_ingredient", pantry),
+    ])
+    response = client.get("/ingredients/device", params={"since": 7})
+    assert response.json() == {"version": 40, "reset": True, "ingredients": pantry}
+
+
+def test_get_without_since_is_the_plain_list(connect, client):
+    pantry = [{"id": 3, "name": "egg", "name_es": "huevo", "img_url": None}]
+    connect([EXISTING_USER, ("SELECT pantry_version", [{"pantry_version": 2}]), ("JOIN user_ingredient", pantry)])
+    response = client.get("/ingredients/device")
+    assert response.json() == pantry
+    assert response.headers["etag"] == '"2"'
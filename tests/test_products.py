@@ -0,0 +1,53 @@
+from products import diff_products, extract_products, iter_products, stream_products, undo_diff
+
+
+def card(i, price="1.990"):
+    return (
+        f"[![Product {i}](https://img.jumbo.cl/{i}.jpg)](https://www.jumbo.cl/p{i}/p) "
+        f"Agregar a Mis listas ${price} [Ver](https://www.jumbo.cl/p{i}/p)"
+    )
+
+
+DOCUMENT = "# Frutas\n\n" + "\n".join(card(i) for i in range(5)) + "\nfooter"
+EXPECTED = [{"name": f"Product {i}", "price": 1990, "url": f"https://www.jumbo.cl/p{i}/p"} for i in range(5)]
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_extract():
+    assert extract_products(DOCUMENT) == EXPECTED
+
+
+def test_any_chunk_size_gives_the_same_products():
+    for size in range(1, len(DOCUMENT) + 1):
+        assert list(iter_products(chunked(DOCUMENT, size))) == EXPECTED, size
+
+
+def test_cards_without_newlines_are_bounded():
+    # One long line: the partial line is scanned and cut once past max_line
+    text = " ".join(card(i) for i in range(50))
+    products = list(iter_products(chunked(text, 64), max_line=1024))
+    assert [p["url"] for p in products] == [f"https://www.jumbo.cl/p{i}/p" for i in range(50)]
+
+
+def test_unusable_price_is_skipped():
+    assert extract_products(card(1, price="a consultar")) == []
+
+
+def test_stream_products(tmp_path):
+    path = tmp_path / "page.md"
+    path.write_text(DOCUMENT, encoding="utf-8")
+    assert list(stream_products(str(path), chunk_size=7)) == EXPECTED
+
+
+def test_undo_diff_rebuilds_the_previous_list():
+    previous = EXPECTED[:3]
+    current = [dict(EXPECTED[0], price=2490)] + EXPECTED[2:]
+    diff = diff_products(previous, current)
+    assert [p["url"] for p in diff["new"]] == [p["url"] for p in EXPECTED[3:]]
+    assert diff["removed"] == [EXPECTED[1]]
+    assert diff["price_changed"] == [dict(EXPECTED[0], price=2490, old_price=1990)]
+    key = lambda p: p["url"]
+    assert sorted(undo_diff(current, diff), key=key) == sorted(previous, key=key)
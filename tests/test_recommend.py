@@ -0,0 +1,50 @@
+import math
+import random
+import pytest
+from recommend import top_neighbors, user_item_matrix
+
+
+def brute_force(pairs, top_k, min_support):
+    users = {}
+    for user_id, item_id in pairs:
+        users.setdefault(item_id, set()).add(user_id)
+    neighbors = {}
+    for item, item_users in users.items():
+        scored = []
+        for other, other_users in users.items():
+            shared = len(item_users & other_users)
+            if other != item and shared >= min_support:
+                scored.append((round(shared / math.sqrt(len(item_users) * len(other_users)), 4), other))
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        neighbors[item] = ([other for _, other in scored[:top_k]], [score for score, _ in scored[:top_k]])
+    return neighbors
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_brute_force(seed):
+    rng = random.Random(seed)
+    pairs = [(rng.randrange(40), rng.choice(range(100, 130))) for _ in range(400)]
+    matrix, item_ids = user_item_matrix(pairs)
+    assert top_neighbors(matrix, item_ids, top_k=5, min_support=2) == brute_force(pairs, 5, 2)
+
+
+def test_ties_at_the_cut_go_by_item_id():
+    # Item 1 shares both its users with 2, 3, 4 and 5 alike
+    pairs = [(u, i) for u in (1, 2) for i in (1, 5, 3, 4, 2)]
+    matrix, item_ids = user_item_matrix(pairs)
+    assert top_neighbors(matrix, item_ids, top_k=2, min_support=1)[1] == ([2, 3], [1.0, 1.0])
+
+
+def test_duplicate_pairs_count_once():
+    pairs = [(1, 10), (1, 10), (1, 11), (2, 10), (2, 11)]
+    matrix, item_ids = user_item_matrix(pairs)
+    assert top_neighbors(matrix, item_ids, min_support=2) == {10: ([11], [1.0]), 11: ([10], [1.0])}
+
+
+def test_only_and_min_support():
+    pairs = [(1, 10), (1, 11), (2, 10), (2, 11), (3, 10), (3, 12)]
+    matrix, item_ids = user_item_matrix(pairs)
+    assert top_neighbors(matrix, item_ids, only=[12], min_support=1) == {12: ([10], [0.5774])}
+    # 12 shares a single user with 10: below the support, it gets no neighbors
+    assert top_neighbors(matrix, item_ids, only=[12], min_support=2) == {12: ([], [])}
+    assert top_neighbors(matrix, item_ids, only=[99]) == {}
@@ -0,0 +1,77 @@
+import pytest
+from suggest import CatalogIndex, PrefixIndex, normalize_prefix
+
+
+def ingredient(id, name, name_es, popularity=0):
+    return {"id": id, "name": name, "name_es": name_es, "img_url": None, "popularity": popularity}
+
+
+@pytest.fixture(scope="module")
+def index():
+    return PrefixIndex([
+        ingredient(1, "Lemon", "Limón", popularity=5),
+        ingredient(2, "Lime", "Lima", popularity=9),
+        ingredient(3, "Lemon Juice", "Jugo de limón", popularity=20),
+        ingredient(4, "Sweet Potato", "Camote", popularity=3),
+        ingredient(5, "Potato", None, popularity=1),
+    ])
+
+
+def ids(results):
+    return [r["id"] for r in results]
+
+
+def test_normalize_prefix():
+    assert normalize_prefix("  Limón  Sut") == "limon sut"
+    assert normalize_prefix(None) == ""
+
+
+def test_leading_words_first_then_popularity(index):
+    assert ids(index.suggest("li")) == [2]
+    assert ids(index.suggest("le")) == [3, 1]
+    # "Potato" starts with it; "Sweet Potato" only has a later word that does
+    assert ids(index.suggest("pot")) == [5, 4]
+
+
+def test_spanish_names_fold_accents(index):
+    assert ids(index.suggest("LIMON", language="es")) == [1, 3]
+    # A missing name_es falls back to the English name
+    assert ids(index.suggest("pota", language="es")) == [5]
+
+
+def test_multi_word_prefix_and_limit(index):
+    assert ids(index.suggest("lemon j")) == [3]
+    assert ids(index.suggest("l", limit=2)) == [3, 2]
+    assert index.suggest("   ") == [] and index.suggest("xyz") == []
+
+
+def test_results_carry_no_popularity(index):
+    assert index.suggest("lime") == [{"id": 2, "name": "Lime", "name_es": "Lima", "img_url": None}]
+    assert len(index) == 5
+
+
+def test_catalog_index_rebuilds_on_version_change():
+    state = {"version": 1, "builds": 0}
+
+    def build():
+        state["builds"] += 1
+        return state["builds"]
+
+    catalog_index = CatalogIndex(build, lambda: state["version"], max_age=3600, check_interval=0)
+    assert catalog_index.get() == 1 and catalog_index.get() == 1
+    state["version"] = 2
+    assert catalog_index.get() == 2
+
+
+def test_catalog_index_keeps_the_previous_index_on_failure():
+    state = {"version": 1}
+
+    def build():
+        if state["version"] > 1:
+            raise RuntimeError("database down")
+        return "index"
+
+    catalog_index = CatalogIndex(build, lambda: state["version"], max_age=3600, check_interval=0)
+    assert catalog_index.get() == "index"
+    state["version"] = 2
+    assert catalog_index.get() == "index"